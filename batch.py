@@ -0,0 +1,139 @@
+# batch.py: Resolve muitas instâncias de Bimaru num só processo principal, com um conjunto de
+# processos de trabalho (multiprocessing), para não pagar o arranque do interpretador por puzzle.
+#
+# Utilização:
+#   python3 batch.py --out-dir sols/ tests/ outra.txt   # escreve sols/<nome>.out para cada instância
+#   python3 batch.py < varias.txt > solucoes.txt         # lê várias instâncias seguidas do stdin
+#
+# No primeiro caso, sem --out-dir, cada <nome>.out fica ao lado da instância; um .out que já
+# exista (como as soluções de referência em tests/) só é substituído com --overwrite.
+# No segundo caso a saída é um fluxo etiquetado: cada solução é precedida de uma linha
+# "SOLUTION<TAB>n" (ou "NOSOLUTION<TAB>n", ou "BUDGET<TAB>n<TAB>motivo" se o orçamento dado por
+# --max-nodes/--timeout se esgotar, ou "ERROR<TAB>n<TAB>mensagem" se a instância não puder ser
+# resolvida, por exemplo por estar mal formada), em que n é a ordem da instância no fluxo a contar
+# de 1. Uma instância com erro não interrompe as outras, mas o código de saída passa a ser 1.
+# O resumo com o tempo de cada instância é escrito no standard error.
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+from utils import print_table
+from search import SearchBudget
+from bimaru import BOARDS, add_solver_arguments, read_buffer, solve, split_buffer, write_output
+
+
+def instance_paths(arguments: list) -> list:
+    """Expande diretórios (todos os *.txt lá dentro) e padrões glob numa lista de ficheiros,
+    sem repetir os que aparecem em mais do que um argumento."""
+    paths = []
+    for argument in arguments:
+        if os.path.isdir(argument):
+            paths += sorted(glob.glob(os.path.join(argument, '*.txt')))
+        else:
+            paths += sorted(glob.glob(argument)) or [argument]
+    return list(dict.fromkeys(os.path.normpath(path) for path in paths))
+
+
+def out_path(name: str, out_dir: str = None) -> str:
+    """Devolve o ficheiro .out da instância name: ao lado dela, ou em out_dir se dado."""
+    stem = os.path.splitext(os.path.basename(name) if out_dir else name)[0]
+    return os.path.join(out_dir or '', stem + '.out')
+
+
+def solve_instance(job: tuple) -> tuple:
+    """Resolve uma instância num processo de trabalho. Recebe (nome, texto, opções) e devolve
+    (nome, solução em bytes ou None, motivo por que o orçamento se esgotou ou None, mensagem de
+    erro ou None, segundos). O orçamento (--max-nodes, --timeout) é de cada instância. Uma
+    exceção (por exemplo, uma instância mal formada) é devolvida como mensagem de erro, para
+    não interromper as outras instâncias."""
+    name, text, options = job
+    start = time.perf_counter()
+    try:
+        board = BOARDS[options['board']].parse_instance(io.StringIO(text))
+        budget = SearchBudget(options['max_nodes'], options['timeout'])
+        solution = solve(board, options['engine'], options['search'], options['branching'], options['lookahead'], budget)
+    except Exception as error:
+        message = ' '.join('{}: {}'.format(type(error).__name__, error).split())
+        return name, None, None, message, time.perf_counter() - start
+    return name, solution.render_bytes() if solution is not None else None, budget.exceeded, None, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resolve várias instâncias de Bimaru em paralelo.")
+    parser.add_argument('instances', nargs='*',
+                        help="ficheiros, diretórios ou padrões glob; sem argumentos lê várias instâncias do stdin")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="número de processos de trabalho (por omissão, um por CPU)")
+    parser.add_argument('--out-dir',
+                        help="diretório para os ficheiros .out (por omissão, ao lado de cada instância)")
+    parser.add_argument('--overwrite', action='store_true',
+                        help="substituir os ficheiros .out que já existam")
+    add_solver_arguments(parser)
+    args = parser.parse_args()
+    options = {name: getattr(args, name) for name in ('board', 'engine', 'search', 'branching', 'lookahead',
+                                                  'max_nodes', 'timeout')}
+
+    if args.instances:
+        paths = instance_paths(args.instances)
+        existing = [out_path(path, args.out_dir) for path in paths if os.path.exists(out_path(path, args.out_dir))]
+        if existing and not args.overwrite:
+            parser.error("os ficheiros {} já existem (use --out-dir ou --overwrite)".format(', '.join(existing)))
+        jobs = []
+        for path in paths:
+            with open(path) as f:
+                jobs.append((path, f.read(), options))
+    else:
+        jobs = [(str(i), text, options) for i, text in enumerate(split_buffer(read_buffer(sys.stdin)), 1)]
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    start = time.perf_counter()
+    summary = []
+    stream = []  # Fluxo etiquetado, escrito de uma só vez no fim (mesmo que algo falhe a meio)
+    errors = 0
+    try:
+        with Pool(max(1, args.workers)) as pool:
+            for name, solution, exceeded, error, elapsed in pool.imap(solve_instance, jobs):
+                if error is not None:
+                    errors += 1
+                    if not args.instances:
+                        stream.append('ERROR\t{}\t{}\n'.format(name, error).encode('utf-8'))
+                elif args.instances:
+                    if solution is not None:
+                        with open(out_path(name, args.out_dir), 'wb') as f:
+                            f.write(solution)
+                elif solution is not None:
+                    stream += ['SOLUTION\t{}\n'.format(name).encode('ascii'), solution]
+                elif exceeded:
+                    stream.append('BUDGET\t{}\t{}\n'.format(name, exceeded).encode('ascii'))
+                else:
+                    stream.append('NOSOLUTION\t{}\n'.format(name).encode('ascii'))
+                if error is not None:
+                    status = 'erro ({})'.format(error)
+                elif solution is not None:
+                    status = 'resolvida'
+                else:
+                    status = 'limite excedido ({})'.format(exceeded) if exceeded else 'sem solução'
+                summary.append([name, status, '{:.1f}'.format(elapsed * 1000)])
+    finally:
+        write_output(stream)
+    wall = time.perf_counter() - start
+
+    total = sum(float(row[2]) for row in summary)
+    summary.append(['total ({} instâncias, {} processos)'.format(len(jobs), max(1, args.workers)), '',
+                    '{:.1f}'.format(total)])
+    summary.append(['tempo real', '', '{:.1f}'.format(wall * 1000)])
+    with redirect_stdout(sys.stderr):
+        print_table(summary, ['instância', 'estado', 'ms'])
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# benchmark.py: Compara as procuras do Bimaru nas instâncias de teste e em famílias de instâncias
+# geradas (generator.py), de 10x10 a 30x30, com várias densidades de pistas e frotas. Para cada instância
+# e procura mede os nós expandidos, os estados gerados, o tempo, os nós por segundo e o pico de
+# memória (tracemalloc), e pode guardar os resultados em JSON e compará-los com uma referência.
+#
+# Utilização:
+#   python3 benchmark.py [--board list|bits] [--branching ship|cell] [instâncias...]
+#   python3 benchmark.py --json resultados.json                  # testes e famílias geradas
+#   python3 benchmark.py --save-baseline                          # atualiza benchmark_baseline.json
+#   python3 benchmark.py --baseline                               # falha se houver regressões
+#
+# Sem instâncias usa tests/instance*.txt e as famílias de FAMILIES. Os nós expandidos são
+# determinísticos e comparados exatamente. O tempo e a memória, que dependem da máquina onde a
+# referência foi obtida, toleram --tolerance e só dão avisos, a não ser com --strict-time.
+
+import argparse
+import glob
+import io
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from search import InstrumentedProblem, astar_search, depth_first_tree_search, greedy_search
+from utils import print_table
+from bimaru import BOARDS, FLEET, Bimaru, depth_first_backtracking_search
+from generator import random_instance
+
+SEARCHERS = {'dfs': depth_first_tree_search, 'backtracking': depth_first_backtracking_search,
+             'astar': astar_search, 'greedy': greedy_search}
+# Frotas das famílias geradas: a normal e uma com porta-aviões de 5 e 6 células
+FLEETS = {'std': FLEET, 'big': {6: 1, 5: 2, 4: 3, 3: 4, 2: 5, 1: 6}}
+# (lado, densidade de pistas, frota) de cada família gerada, com FAMILY_SIZE instâncias cada
+FAMILIES = [(side, density, 'std') for side in (10, 15, 20, 25, 30) for density in (0.02, 0.1)] \
+    + [(side, 0.1, 'big') for side in (15, 20)]
+FAMILY_SIZE = 2
+BASELINE = 'benchmark_baseline.json'
+# Diferenças abaixo destes valores são ruído e nunca contam como regressão numa instância; o
+# tempo total de cada procura é comparado só com a tolerância relativa
+MIN_SLOWDOWN = 0.05  # segundos
+MIN_GROWTH = 64  # KiB
+# Medidas em que uma regressão faz falhar --baseline; as outras só falham com --strict-time
+HARD_MEASURES = ('solved', 'expanded')
+
+
+def generated_instances(seed: int = 0) -> list:
+    """Devolve (nome, texto) das instâncias das famílias de FAMILIES, sempre as mesmas para a
+    mesma semente."""
+    rng = random.Random(seed)
+    return [('gen-{0}x{0}-{1:.2f}{2}-{3}'.format(side, density, '' if fleet == 'std' else '-' + fleet, i),
+             random_instance(side, side, density, FLEETS[fleet], rng))
+            for side, density, fleet in FAMILIES for i in range(FAMILY_SIZE)]
+
+
+def run(searcher, text: str, board_class, branching: str, repeat: int = 1, memory: bool = True) -> dict:
+    """Resolve a instância com a procura dada e devolve as medidas: nós expandidos e estados
+    gerados, o melhor tempo de repeat execuções, nós expandidos por segundo, o pico de memória
+    numa execução à parte com tracemalloc (que a torna mais lenta) e se a solução está correta.
+    A leitura da instância fica fora das medidas."""
+    elapsed = float('inf')
+    for _ in range(repeat):
+        problem = InstrumentedProblem(Bimaru(board_class.parse_instance(io.StringIO(text)), branching))
+        start = time.perf_counter()
+        node = searcher(problem)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    result = {'expanded': problem.succs, 'generated': problem.states, 'time_s': elapsed,
+              'nodes_per_s': problem.succs / elapsed if elapsed else 0.0,
+              'solved': node is not None and problem.problem.goal_test(node.state)}
+    if memory:
+        problem = Bimaru(board_class.parse_instance(io.StringIO(text)), branching)
+        tracemalloc.start()
+        searcher(problem)
+        result['peak_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Compara os resultados com os da referência e devolve uma linha por regressão: uma
+    solução que deixou de ser encontrada, mais nós expandidos, ou tempo ou memória acima da
+    referência por mais de tolerance (e acima do ruído), ou o tempo total de uma procura acima
+    do total da referência por mais de tolerance. Instâncias ou procuras que não estão nos dois
+    lados são ignoradas."""
+    found, totals = [], {}
+    for name, searches in results.items():
+        for searcher, new in searches.items():
+            old = baseline.get(name, {}).get(searcher)
+            if old is None:
+                continue
+            total = totals.setdefault(searcher, [0.0, 0.0])
+            total[0] += old['time_s']
+            total[1] += new['time_s']
+            if old['solved'] and not new['solved']:
+                found.append([name, searcher, 'solved', old['solved'], new['solved']])
+            if new['expanded'] > old['expanded']:
+                found.append([name, searcher, 'expanded', old['expanded'], new['expanded']])
+            if new['time_s'] > old['time_s'] * (1 + tolerance) and new['time_s'] - old['time_s'] > MIN_SLOWDOWN:
+                found.append([name, searcher, 'time_s', '{:.4f}'.format(old['time_s']), '{:.4f}'.format(new['time_s'])])
+            if 'peak_kib' in old and 'peak_kib' in new and new['peak_kib'] > old['peak_kib'] * (1 + tolerance) \
+                    and new['peak_kib'] - old['peak_kib'] > MIN_GROWTH:
+                found.append([name, searcher, 'peak_kib', '{:.0f}'.format(old['peak_kib']), '{:.0f}'.format(new['peak_kib'])])
+    for searcher, (old, new) in totals.items():
+        if new > old * (1 + tolerance):
+            found.append(['total', searcher, 'time_s', '{:.4f}'.format(old), '{:.4f}'.format(new)])
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara as procuras do Bimaru nas instâncias de teste e geradas.")
+    parser.add_argument('instances', nargs='*',
+                        help="ficheiros de instâncias (por omissão tests/instance*.txt e as famílias geradas)")
+    parser.add_argument('--board', choices=BOARDS, default='list')
+    parser.add_argument('--branching', choices=('ship', 'cell'), default='ship')
+    parser.add_argument('--searchers', nargs='+', choices=SEARCHERS, default=['dfs', 'backtracking', 'greedy'],
+                        help="procuras a comparar (a A* fica de fora por omissão: com poucas pistas há "
+                             "muitos tabuleiros com o mesmo custo e demora segundos mesmo em 10x10)")
+    parser.add_argument('--seed', type=int, default=0, help="semente das famílias geradas")
+    parser.add_argument('--repeat', type=int, default=3, help="execuções por medida de tempo (conta a melhor)")
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="não medir o pico de memória")
+    parser.add_argument('--json', help="escrever os resultados neste ficheiro")
+    parser.add_argument('--save-baseline', nargs='?', const=BASELINE, metavar='FILE',
+                        help="guardar os resultados como referência (por omissão em {})".format(BASELINE))
+    parser.add_argument('--baseline', nargs='?', const=BASELINE, metavar='FILE',
+                        help="comparar com a referência e falhar se houver regressões")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="aumento relativo de tempo ou memória tolerado (por omissão 0.5)")
+    parser.add_argument('--strict-time', action='store_true',
+                        help="com --baseline, falhar também com regressões de tempo ou memória")
+    args = parser.parse_args()
+
+    instances = []
+    for path in args.instances or sorted(glob.glob('tests/instance*.txt')):
+        with open(path) as f:
+            instances.append((path, f.read()))
+    if not args.instances:
+        instances += generated_instances(args.seed)
+
+    results, table = {}, []
+    totals = {name: [0, 0, 0.0] for name in args.searchers}
+    for name, text in instances:
+        results[name] = {}
+        row = [name]
+        for searcher in args.searchers:
+            result = run(SEARCHERS[searcher], text, BOARDS[args.board], args.branching, args.repeat, args.memory)
+            results[name][searcher] = result
+            row.append('{}/{} {:.1f}ms{}{}'.format(result['expanded'], result['generated'], result['time_s'] * 1000,
+                                                   ' {:.0f}KiB'.format(result['peak_kib']) if args.memory else '',
+                                                   '' if result['solved'] else ' FALHOU'))
+            totals[searcher][0] += result['expanded']
+            totals[searcher][1] += result['generated']
+            totals[searcher][2] += result['time_s'] * 1000
+        table.append(row)
+    table.append(['total'] + ['{}/{} {:.1f}ms'.format(*totals[name]) for name in args.searchers])
+    print_table(table, ['instância'] + ['{} (expandidos/gerados tempo{})'.format(name, ' memória' if args.memory else '')
+                                        for name in args.searchers])
+
+    report = {'options': {'board': args.board, 'branching': args.branching, 'seed': args.seed},
+              'results': results}
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=1, sort_keys=True)
+                f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['options'] != report['options']:
+            sys.exit("A referência {} foi obtida com outras opções: {}".format(args.baseline, baseline['options']))
+        found = regressions(results, baseline['results'], args.tolerance)
+        failures = [row for row in found if args.strict_time or row[2] in HARD_MEASURES]
+        if found:
+            print()
+            print_table(found, ['instância', 'procura', 'medida', 'referência', 'agora'])
+        if failures:
+            sys.exit("{} regressões em relação a {}".format(len(failures), args.baseline))
+        if found:
+            print("Sem regressões em relação a {}; {} avisos de tempo ou memória (falham com --strict-time)"
+                  .format(args.baseline, len(found)))
+        else:
+            print("Sem regressões em relação a {}".format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,26 @@
 # 102890 David Nunes
 
 import sys
+import os
+import mmap
+import queue
+import random
+import time
+import traceback
+import multiprocessing
+from collections import namedtuple
 from search import (
     Problem,
     Node,
+    SearchBudget,
     astar_search,
     breadth_first_tree_search,
+    depth_first_graph_search,
     depth_first_tree_search,
-    greedy_search
+    greedy_search,
+    run_search
 )
+from sat import Solver, add_clause, add_exactly, define_and, negate
 
 
 TOP = ['T', 't']
@@ -25,8 +37,47 @@ MIDDLE = ['M', 'm']
 CIRCLE = ['C', 'c']
 EMPTY_SPACE = [None, '.', 'W']
 EMPTY_ADJACENT = [(x, y) for x in EMPTY_SPACE for y in EMPTY_SPACE]
+FLEET = {4: 1, 3: 2, 2: 3, 1: 4}  # Frota normal: número de barcos de cada tamanho
+BORDER = '#'
+MMAP_THRESHOLD = 1 << 24  # Ficheiros a partir deste tamanho são lidos com mmap
+# Códigos das células de Board: o código ASCII de cada valor, 0 para as células por preencher e
+# EDGE para o limite à volta da grelha
+UNKNOWN, WATER, PLACEHOLDER, EDGE = 0, ord('.'), ord('x'), ord(BORDER)
+CODES = {value: ord(value) for value in 'TBLRMCtblrmcxW.'}
+CODES.update({None: UNKNOWN, BORDER: EDGE})
+VALUES = {code: value for value, code in CODES.items()}
+SHAPES = {code: value.lower() for value, code in CODES.items() if value and value in 'TBLRMCtblrmcx'}
+
+
+def code_table(values) -> bytes:
+    """Devolve uma tabela indexada pelo código de uma célula, com 1 nos códigos dos valores dados,
+    para testar a categoria de uma célula com table[code] em vez de procurar numa lista."""
+    table = bytearray(256)
+    for value in values:
+        table[CODES[value]] = 1
+    return bytes(table)
+
+
+# Categorias das células de Board. O limite conta como água onde uma célula fora da grelha
+# contaria (IS_CLOSED, IS_EMPTY), mas não nas regras que só olham para a água dentro da grelha.
+IS_SHIP = code_table('TBLRMCtblrmcx')
+IS_HINT = code_table('TBLRMCW')
+IS_WATER = code_table('.W')
+IS_DOT = code_table('.')
+IS_CLOSED = code_table(['.', 'W', BORDER])
+IS_EMPTY = code_table(EMPTY_SPACE + [BORDER])
+IN_ROW_RUN = code_table(['x'] + RIGHT + MIDDLE)
+IN_COL_RUN = code_table(['x'] + BOTTOM + MIDDLE)
+# Valores que as vizinhas de uma célula vazia podem ter para ela ainda poder ser uma peça de barco
+SHIP_RIGHT = code_table(['x', BORDER] + EMPTY_SPACE + MIDDLE + RIGHT)
+SHIP_LEFT = code_table(['x', BORDER] + EMPTY_SPACE + MIDDLE + LEFT)
+SHIP_BELOW = code_table(['x', BORDER] + EMPTY_SPACE + MIDDLE + BOTTOM)
+SHIP_ABOVE = code_table(['x', BORDER] + EMPTY_SPACE + MIDDLE + TOP)
+# Tradução dos códigos para o texto de print_board(); o limite no fim de cada linha passa a mudança de linha
+OUTPUT_TABLE = bytes.maketrans(bytes([UNKNOWN, EDGE]), b'?\n')
 
 class BimaruState:
+    __slots__ = ('board', 'id')
     state_id = 0
 
     def __init__(self, board):
@@ -37,57 +88,480 @@ class BimaruState:
     def __lt__(self, other):
         return self.id < other.id
 
+    def __eq__(self, other):
+        return isinstance(other, BimaruState) and self.board == other.board
+
+    def __hash__(self):
+        return hash(self.board)
+
     def get_board(self) -> 'Board':
         return self.board
 
 ####################################################################################################
 
-class Board:
-    """Representação interna de um tabuleiro de Bimaru."""
+Placement = namedtuple('Placement', 'action cells ends')
+
+
+def ship_move(size: int, orientation: str) -> str:
+    """Devolve as peças de um barco de tamanho size, da primeira à última célula: 'c' para um
+    submarino, 'tm...mb' na vertical e 'lm...mr' na horizontal."""
+    if size == 1:
+        return 'c'
+    first, last = ('t', 'b') if orientation == 'v' else ('l', 'r')
+    return first + 'm' * (size - 2) + last
+
+
+def parse_fleet(tokens: list) -> dict:
+    """Lê os campos de uma linha FLEET, pares tamanho:número (por exemplo 5:1 4:1 3:2), e devolve
+    a frota como um dicionário."""
+    fleet = {}
+    for token in tokens:
+        size, count = token.split(':')
+        fleet[int(size)] = int(count)
+    if not fleet or min(fleet) < 1 or min(fleet.values()) < 0:
+        raise ValueError("frota inválida: {}".format(' '.join(tokens)))
+    return fleet
+
+
+def write_output(chunks, out=None):
+    """Junta os bytes dados (por exemplo, de render_bytes() de muitas soluções) e escreve-os de
+    uma só vez em out (por omissão, o standard output), pelo buffer binário se existir."""
+    data = b''.join(chunks)
+    out = out if out is not None else sys.stdout
+    binary = getattr(out, 'buffer', None)
+    if binary is None:  # Por exemplo, io.StringIO ou redirect_stdout
+        out.write(data.decode('utf-8'))
+    else:
+        out.flush()  # Não trocar a ordem com o que já foi escrito em modo texto
+        binary.write(data)
+        binary.flush()
+
+
+def read_buffer(from_input=sys.stdin):
+    """Lê de uma só vez todo o conteúdo de um ficheiro aberto (em modo texto ou binário).
+    Os ficheiros normais com pelo menos MMAP_THRESHOLD bytes são mapeados em memória com mmap,
+    para que o sistema os vá lendo à medida que as instâncias são processadas."""
+    binary = getattr(from_input, 'buffer', from_input)
+    try:
+        fileno = binary.fileno()
+        if binary.tell() == 0 and os.fstat(fileno).st_size >= MMAP_THRESHOLD:
+            return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        pass  # Sem descritor (io.StringIO) ou sem posição (pipe): lê tudo
+    return binary.read()
+
+
+def split_buffer(buffer):
+    """Divide o conteúdo lido por read_buffer (bytes, str ou mmap) no texto de cada instância,
+    que começa sempre por ROW. Gera str, uma instância de cada vez."""
+    marker = 'ROW' if isinstance(buffer, str) else b'ROW'
+    start = buffer.find(marker)
+    while start != -1:
+        end = buffer.find(marker, start + 3)
+        chunk = buffer[start:end] if end != -1 else buffer[start:]
+        yield chunk if isinstance(chunk, str) else chunk.decode('ascii')
+        start = end
+
+
+def parse_tokens(tokens: list) -> tuple:
+    """Interpreta os campos de uma instância (ROW ..., COLUMN ..., FLEET ... opcional, número de
+    pistas e HINT linha coluna peça, sem olhar para as mudanças de linha) e devolve
+    (totais das linhas, totais das colunas, frota ou None, pistas como (linha, coluna, peça)).
+    Levanta ValueError se os campos estiverem mal formados ou se uma pista estiver fora do
+    tabuleiro ou não for uma das peças TBLRMCW."""
+    try:
+        column = tokens.index('COLUMN')
+        hint = tokens.index('HINT', column) if 'HINT' in tokens else len(tokens)
+        count = int(tokens[hint - 1])
+        fleet = None
+        if 'FLEET' in tokens:
+            end = tokens.index('FLEET')
+            fleet = parse_fleet(tokens[end + 1:hint - 1])
+        else:
+            end = hint - 1
+        row_totals = [int(value) for value in tokens[1:column]]
+        col_totals = [int(value) for value in tokens[column + 1:end]]
+        fields = tokens[hint:]
+        if tokens[0] != 'ROW' or len(fields) != 4 * count or fields[::4].count('HINT') != count:
+            raise ValueError
+        hints = [(int(row), int(col), piece) for row, col, piece in zip(fields[1::4], fields[2::4], fields[3::4])]
+        for row, col, piece in hints:
+            if not (0 <= row < len(row_totals) and 0 <= col < len(col_totals)) or len(piece) != 1 or piece not in 'TBLRMCW':
+                raise ValueError
+    except ValueError:
+        raise ValueError("instância mal formada: {}".format(' '.join(tokens[:8]))) from None
+    return row_totals, col_totals, fleet, hints
+
+
+def read_instances(from_input=sys.stdin):
+    """Gera (totais das linhas, totais das colunas, frota, pistas) de cada instância do ficheiro,
+    que pode ter várias instâncias seguidas. O ficheiro é lido de uma só vez (read_buffer) e
+    cada instância é dividida em campos sem eval nem readline."""
+    buffer = read_buffer(from_input)
+    try:
+        for chunk in split_buffer(buffer):
+            yield parse_tokens(chunk.split())
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+
+def placement_index(rows: int, cols: int, size: int, cache={}) -> list:
+    """Devolve todas as posições de um barco de tamanho size num tabuleiro rows x cols, pela
+    ordem em que as ações são geradas (por linha e coluna, primeiro na vertical).
+
+    Cada posição guarda a ação, as células do barco (com os valores que podem ter e o índice
+    da linha ou coluna perpendicular) e as células nas pontas. A água à volta do barco não é
+    guardada: Board marca-a na propagação e BitBoard calcula-a com máscaras. O índice é
+    calculado uma vez por geometria e partilhado por todos os tabuleiros com as mesmas dimensões."""
+    key = (rows, cols, size)
+    if key in cache:
+        return cache[key]
+    inside = lambda cell: 0 <= cell[0] < rows and 0 <= cell[1] < cols
+    if size == 1:
+        orientations = (('h', ship_move(1, 'h'), [frozenset(['x', None] + CIRCLE)]),)
+    else:
+        orientations = (('v', ship_move(size, 'v'), [frozenset(['x', None] + shapes) for shapes in [TOP] + [MIDDLE] * (size - 2) + [BOTTOM]]),
+                        ('h', ship_move(size, 'h'), [frozenset(['x', None] + shapes) for shapes in [LEFT] + [MIDDLE] * (size - 2) + [RIGHT]]))
+    placements = []
+    for row in range(rows):
+        for col in range(cols):
+            for orientation, move, allowed in orientations:
+                d_row, d_col = (1, 0) if orientation == 'v' else (0, 1)
+                if row + d_row * (size - 1) >= rows or col + d_col * (size - 1) >= cols:
+                    continue
+                cells = []
+                for i in range(size):
+                    r, c = row + d_row * i, col + d_col * i
+                    cells.append((r, c, allowed[i], r if orientation == 'v' else c))
+                if size == 1:
+                    ends = [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]
+                else:
+                    ends = [(row - d_row, col - d_col), (row + d_row * size, col + d_col * size)]
+                placements.append(Placement((row, col, move, orientation), tuple(cells), tuple(filter(inside, ends))))
+    cache[key] = placements
+    return placements
+
+
+def board_placements(rows: int, cols: int, size: int, cache={}) -> list:
+    """Devolve o índice de placement_index na forma usada por Board: (ação, células do barco
+    como (posição, tabela dos códigos permitidos, índice da linha ou coluna perpendicular),
+    posições das pontas)."""
+    key = (rows, cols, size)
+    if key not in cache:
+        width = cols + 1
+        placements = placement_index(rows, cols, size)
+        tables = {allowed: code_table(allowed) for placement in placements for _, _, allowed, _ in placement.cells}
+        cache[key] = [(placement.action,
+                       tuple(((r + 1) * width + c + 1, tables[allowed], cross) for r, c, allowed, cross in placement.cells),
+                       tuple((r + 1) * width + c + 1 for r, c in placement.ends))
+                      for placement in placements]
+    return cache[key]
+
+
+def placement_position(rows: int, cols: int, action: tuple, cache={}) -> int:
+    """Devolve a posição da ação no índice de posições do seu tamanho de barco."""
+    key = (rows, cols, len(action[2]))
+    if key not in cache:
+        cache[key] = {placement.action: i for i, placement in enumerate(placement_index(*key))}
+    return cache[key][action]
+
+
+def max_disjoint_placements(actions: list, size: int) -> int:
+    """Devolve um majorante do número de barcos de tamanho size que se podem colocar ao mesmo
+    tempo nas ações dadas: em cada linha (ou coluna) escolhe gulosamente as posições que acabam
+    primeiro, deixando uma célula de água entre barcos, e soma as linhas e colunas."""
+    lines = {}
+    for row, col, _, orientation in actions:
+        if orientation == 'v' and size > 1:
+            lines.setdefault(('v', col), []).append(row)
+        else:
+            lines.setdefault(('h', row), []).append(col)
+    total = 0
+    for starts in lines.values():
+        free = None  # Primeira posição onde pode começar o próximo barco da linha
+        for start in sorted(starts):
+            if free is None or start >= free:
+                total += 1
+                free = start + size + 1
+    return total
+
+
+def totals_feasible(row_left: list, col_left: list, unknown: list) -> bool:
+    """Verifica se as peças de barco que faltam em cada linha e coluna podem ser distribuídas
+    pelas células por preencher, como um fluxo máximo num grafo bipartido linhas-colunas em que
+    cada célula por preencher é uma aresta de capacidade 1."""
+    if sum(row_left) != sum(col_left) or min(row_left + col_left, default=0) < 0:
+        return False
+    rows = len(row_left)
+    adjacent = [[] for _ in range(rows)]
+    for row, col in unknown:
+        adjacent[row].append(col)
+    chosen = [set() for _ in col_left]  # Linhas cujas células de cada coluna levam uma peça
+    col_flow = [0] * len(col_left)
+    for row in range(rows):
+        for _ in range(row_left[row]):
+            # Caminho de aumento: linha -> coluna por uma célula livre, coluna -> linha por uma escolhida
+            parent, queue, end = {row: None}, [row], None
+            for node in queue:
+                if node < rows:
+                    for col in adjacent[node]:
+                        if node not in chosen[col] and rows + col not in parent:
+                            parent[rows + col] = node
+                            queue.append(rows + col)
+                            if col_flow[col] < col_left[col]:
+                                end = rows + col
+                                break
+                    if end is not None:
+                        break
+                else:
+                    for other in chosen[node - rows]:
+                        if other not in parent:
+                            parent[other] = node
+                            queue.append(other)
+            if end is None:
+                return False
+            col_flow[end - rows] += 1
+            node = end
+            while parent[node] is not None:
+                previous = parent[node]
+                if node >= rows:
+                    chosen[node - rows].add(previous)
+                else:
+                    chosen[previous - rows].discard(node)
+                node = previous
+    return True
+
+
+def zobrist_key(row: int, col: int, value, keys={}, rng=random.Random(0)) -> int:
+    """Devolve o número aleatório de 64 bits associado ao valor value na posição (row, col).
+    O hash de Zobrist de um tabuleiro é o XOR das chaves das suas células preenchidas. As chaves
+    são geradas quando são pedidas pela primeira vez e partilhadas por todos os tabuleiros."""
+    key = (row, col, value)
+    if key not in keys:
+        keys[key] = rng.getrandbits(64)
+    return keys[key]
+
+
+class TranspositionTable:
+    """Tabela limitada de tabuleiros já explorados sem encontrar solução.
+
+    As entradas são indexadas pelo hash do tabuleiro e guardam a sua chave estrutural, para que
+    uma colisão de hashes nunca corte um ramo com solução. Quando a tabela enche, as entradas
+    mais antigas são descartadas."""
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.table = {}
+        self.hits = 0
+
+    def add(self, board):
+        """Regista o tabuleiro como sem solução."""
+        table = self.table
+        if len(table) >= self.maxsize:
+            del table[next(iter(table))]
+        table[hash(board)] = board.key()
+
+    def __contains__(self, board) -> bool:
+        key = self.table.get(hash(board))
+        if key is not None and key == board.key():
+            self.hits += 1
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+class Trail:
+    """Registo das alterações feitas a um tabuleiro, para backtracking sem cópias.
+
+    Cada entrada é um triplo (contentor, chave, valor antigo); desfazer uma alteração
+    é repor contentor[chave] = valor antigo. O trail só está ativo depois de mark()."""
+    trail = None
+
+    def _set_attr(self, name: str, value):
+        """Altera um atributo do tabuleiro, guardando o valor antigo no trail se estiver ativo."""
+        if self.trail is not None:
+            self.trail.append((self.__dict__, name, getattr(self, name)))
+        setattr(self, name, value)
+
+    def _set_item(self, container: list, index: int, value):
+        """Altera um elemento de uma lista do tabuleiro, guardando o valor antigo no trail se estiver ativo."""
+        if self.trail is not None:
+            self.trail.append((container, index, container[index]))
+        container[index] = value
+
+    def _add(self, counters: list, index: int, delta: int):
+        """Soma delta a um contador, guardando o valor antigo no trail se estiver ativo."""
+        if self.trail is not None:
+            self.trail.append((counters, index, counters[index]))
+        counters[index] += delta
+
+    def mark(self) -> int:
+        """Ativa o trail e devolve uma marca para onde se pode voltar com undo()."""
+        if self.trail is None:
+            self.trail = []
+        return len(self.trail)
+
+    def undo(self, mark: int):
+        """Desfaz todas as alterações feitas depois da marca."""
+        trail = self.trail
+        while len(trail) > mark:
+            container, key, old_value = trail.pop()
+            container[key] = old_value
+
+
+class Board(Trail):
+    """Representação interna de um tabuleiro de Bimaru.
+
+    As células estão guardadas num só bytearray, linha a linha, com os códigos de CODES. À volta
+    da grelha há um limite de células EDGE (uma linha em cima, outra em baixo e uma coluna entre
+    o fim de cada linha e o início da seguinte), para que as vizinhas de qualquer célula se leiam
+    sem verificar os limites: a célula (row, col) está na posição (row + 1) * width + col + 1,
+    com width = cols + 1, e as vizinhas estão a ±1 e ±width."""
     impossible = False
-    num_battleships = 1
-    num_cruisers = 2
-    num_destroyers = 3
-    num_submarines = 4
 
-    def __init__(self, rows: int, cols: int):
-        """Construtor: recebe o número de linhas e colunas do tabuleiro."""
+    def __init__(self, rows: int, cols: int, fleet: dict = None):
+        """Construtor: recebe o número de linhas e colunas do tabuleiro e a frota (número de
+        barcos de cada tamanho; por omissão, a frota normal)."""
         self.rows = rows
         self.cols = cols
-        self.board = [[None for _ in range(cols + 1)] for _ in range(rows + 1)] # +1 para guardar os valores totais da linha e coluna
+        self.fleet = dict(fleet or FLEET)
+        self.max_size = max(self.fleet)
+        # Barcos de cada tamanho que falta colocar, indexados pelo tamanho
+        self.remaining = [self.fleet.get(size, 0) for size in range(self.max_size + 1)]
+        self.width = cols + 1
+        self.cells = bytearray([EDGE]) * ((rows + 2) * self.width + 1)
+        for row in range(rows):
+            start = self.position(row, 0)
+            self.cells[start:start + cols] = bytes(cols)
+        # Contadores por linha e coluna: peças de barco por colocar (o total menos as já colocadas)
+        # e células vazias
+        self.row_remaining = [0] * rows
+        self.col_remaining = [0] * cols
+        self.row_unknown = [cols] * rows
+        self.col_unknown = [rows] * cols
+        # Posição no índice do último barco de cada tamanho escolhido na procura
+        self.last_placement = [-1] * (self.max_size + 1)
+        # Hash de Zobrist das células preenchidas, atualizado em cada escrita
+        self.zobrist = 0
+        # Células (por posição), linhas e colunas por rever na próxima propagação
+        self.dirty_cells = {self.position(row, col) for row in range(rows) for col in range(cols)}
+        self.dirty_rows = set(range(rows))
+        self.dirty_cols = set(range(cols))
+        self.changed = set(self.dirty_cells)
+
+    def position(self, row: int, col: int) -> int:
+        """Devolve a posição da célula (row, col) em self.cells."""
+        return (row + 1) * self.width + col + 1
+
+    def cell(self, pos: int) -> tuple:
+        """Devolve a linha e a coluna da célula na posição pos de self.cells."""
+        row, col = divmod(pos - 1, self.width)
+        return row - 1, col
+
+    def _write(self, pos: int, value: int):
+        """Escreve o código na posição, guardando o valor antigo no trail se estiver ativo,
+        e atualiza os contadores da linha e coluna."""
+        cells = self.cells
+        old_value = cells[pos]
+        if self.trail is not None:
+            self.trail.append((cells, pos, old_value))
+        cells[pos] = value
+        width = self.width
+        row, col = divmod(pos - 1, width)
+        row -= 1
+        zobrist = self.zobrist ^ zobrist_key(row, col, value)
+        if old_value == UNKNOWN:
+            self._add(self.row_unknown, row, -1)
+            self._add(self.col_unknown, col, -1)
+        else:
+            zobrist ^= zobrist_key(row, col, old_value)
+        self._set_attr('zobrist', zobrist)
+        self.dirty_cells.update((pos, pos - width, pos + width, pos - 1, pos + 1))
+        self.dirty_rows.add(row)
+        self.dirty_cols.add(col)
+        self.changed.add(pos)
+
+    def fleet_key(self) -> tuple:
+        """Devolve a frota que falta colocar, a posição do último barco de cada tamanho e se o
+        tabuleiro é impossível (o que pode depender do caminho, ver count_placement)."""
+        return tuple(self.remaining), tuple(self.last_placement), self.impossible
+
+    def key(self) -> tuple:
+        """Devolve uma chave imutável que identifica o tabuleiro para a procura."""
+        return bytes(self.cells), self.fleet_key()
+
+    def __hash__(self):
+        return hash((self.zobrist, self.fleet_key()))
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.zobrist == other.zobrist and self.cells == other.cells \
+            and self.fleet_key() == other.fleet_key()
+
+    def count_ship(self, size: int):
+        """Retira um barco do tamanho dado à frota que falta colocar. Se já não houver barcos
+        desse tamanho por colocar, o tabuleiro fica impossível."""
+        self._add(self.remaining, size, -1)
+        if self.remaining[size] < 0:
+            self._set_attr('impossible', True)
+
+    def count_placement(self, action: tuple):
+        """Conta o barco completado pela ação. Se ficar numa posição anterior à do último barco do
+        mesmo tamanho escolhido com place_ship(), o ramo não segue a ordem canónica (ver
+        possible_actions) e o tabuleiro fica impossível: as soluções a que chegaria são
+        alcançadas no ramo que escolhe primeiro este barco."""
+        size = len(action[2])
+        self.count_ship(size)
+        if placement_position(self.rows, self.cols, action) < self.last_placement[size]:
+            self._set_attr('impossible', True)
 
     def set_value(self, row: int, col: int, value):
         """Altera o valor na respetiva posição do tabuleiro."""
-        if self.get_value(row, col) is None or isinstance(value, int) or not self.get_value(row, col).isupper():
-            self.board[row][col] = value
+        pos = self.position(row, col)
+        if not IS_HINT[self.cells[pos]]:
+            self._write(pos, CODES[value])
 
     def get_value(self, row: int, col: int) -> str or None:
         """Devolve o valor na respetiva posição do tabuleiro."""
         if row < 0 or row >= self.rows or col < 0 or col >= self.cols:
             return None
-        return self.board[row][col]
+        return VALUES[self.cells[(row + 1) * self.width + col + 1]]
 
     def get_row_total(self, row: int) -> int:
         """Devolve o número de peças de barco que faltam colocar na linha."""
-        return int(self.board[row][self.cols])
-    
+        return self.row_remaining[row]
+
     def get_col_total(self, col: int) -> int:
         """Devolve o número de peças de barco que faltam colocar na coluna."""
-        return int(self.board[self.rows][col])
-    
+        return self.col_remaining[col]
+
     def lower_total(self, row: int, col: int):
         """Diminui o número de barcos por colocar na linha e coluna."""
-        self.set_value(row, self.cols, self.get_row_total(row) - 1)
-        self.set_value(self.rows, col, self.get_col_total(col) - 1)
+        self._add(self.row_remaining, row, -1)
+        self._add(self.col_remaining, col, -1)
+        self.dirty_rows.add(row)
+        self.dirty_cols.add(col)
+
+    def is_full(self) -> bool:
+        """Verifica se todas as células estão preenchidas e todos os totais atingidos."""
+        return not any(self.row_unknown) and not any(self.row_remaining) and not any(self.col_remaining)
 
     def copy(self) -> 'Board':
         """Devolve uma cópia do tabuleiro."""
-        new_board = Board(self.rows, self.cols)
-        new_board.board = [[self.board[row][col] for col in range(self.cols + 1)] for row in range(self.rows + 1)]
-        new_board.num_battleships = self.num_battleships
-        new_board.num_cruisers = self.num_cruisers
-        new_board.num_destroyers = self.num_destroyers
-        new_board.num_submarines = self.num_submarines
+        new_board = Board.__new__(Board)
+        new_board.rows = self.rows
+        new_board.cols = self.cols
+        new_board.fleet, new_board.max_size = self.fleet, self.max_size
+        new_board.width, new_board.cells = self.width, self.cells[:]
+        new_board.row_remaining, new_board.col_remaining = self.row_remaining[:], self.col_remaining[:]
+        new_board.row_unknown, new_board.col_unknown = self.row_unknown[:], self.col_unknown[:]
+        new_board.dirty_cells, new_board.dirty_rows, new_board.dirty_cols = set(self.dirty_cells), set(self.dirty_rows), set(self.dirty_cols)
+        new_board.changed = set(self.changed)
+        new_board.remaining = self.remaining[:]
+        new_board.last_placement = self.last_placement[:]
+        new_board.zobrist = self.zobrist
         return new_board
 
     def remove_complete_hints(self, list_hints):
@@ -98,400 +572,311 @@ class Board:
             if (row, col) in used_hints:
                 continue
             if cur == 'C':
-                self.num_submarines -= 1
+                self.count_ship(1)
                 used_hints.append((row, col))
-            elif cur == 'T':
-                if self.get_value(row + 1, col) == 'B':
-                    self.num_destroyers -= 1
-                    used_hints.append((row, col))
-                elif self.get_value(row + 1, col) == 'M':
-                    if self.get_value(row + 2, col) == 'B':
-                        self.num_cruisers -= 1
-                        used_hints.append((row, col))
-                    elif self.get_value(row + 2, col) == 'M':
-                        if self.get_value(row + 3, col) == 'B':
-                            self.num_battleships -= 1
-                            used_hints.append((row, col))
-            elif cur == 'L':
-                if self.get_value(row, col + 1) == 'R':
-                    self.num_destroyers -= 1
-                    used_hints.append((row, col))
-                elif self.get_value(row, col + 1) == 'M':
-                    if self.get_value(row, col + 2) == 'R':
-                        self.num_cruisers -= 1
+            elif cur in ('T', 'L'):
+                # Segue as pistas de meio até à pista da outra ponta
+                d_row, d_col, end = (1, 0, 'B') if cur == 'T' else (0, 1, 'R')
+                for size in range(2, self.max_size + 1):
+                    value = self.get_value(row + d_row * (size - 1), col + d_col * (size - 1))
+                    if value == end:
+                        self.count_ship(size)
                         used_hints.append((row, col))
-                    elif self.get_value(row, col + 2) == 'M':
-                        if self.get_value(row, col + 3) == 'R':
-                            self.num_battleships -= 1
-                            used_hints.append((row, col))
+                    if value != 'M':
+                        break
+
+    def _fill_ship(self, pos: int) -> bool:
+        """Marca a célula como peça de barco (placeholder) se ainda estiver vazia."""
+        if self.cells[pos] != UNKNOWN:
+            return False
+        self._write(pos, PLACEHOLDER)
+        self.lower_total(*self.cell(pos))
+        return True
 
-    def fill_pos_water(self, row: int, col: int, value: str) -> bool:
+    def _fill_water(self, pos: int) -> bool:
+        """Marca a célula como água se ainda estiver vazia."""
+        if self.cells[pos] != UNKNOWN:
+            return False
+        self._write(pos, WATER)
+        return True
+
+    def fill_pos_water(self, pos: int, value: int) -> bool:
         """Preenche as células que são necessáriamente água à volta de uma peça de barco."""
+        if not IS_SHIP[value]:
+            return False
+        cells, width = self.cells, self.width
         made_changes = False
-        if not value in EMPTY_SPACE:
-            if row > 0:
-                if col > 0 and self.board[row-1][col-1] is None:
-                    self.board[row-1][col-1] = '.'
-                    made_changes = True
-                if col < self.cols-1 and self.board[row-1][col+1] is None:
-                    self.board[row-1][col+1] = '.'
-                    made_changes = True
-            if row < self.rows-1:
-                if col > 0 and self.board[row+1][col-1] is None:
-                    self.board[row+1][col-1] = '.'
-                    made_changes = True
-                if col < self.cols-1 and self.board[row+1][col+1] is None:
-                    self.board[row+1][col+1] = '.'
-                    made_changes = True
-        if value in TOP:
-            if self.board[row+1][col] is None:
-                self.board[row+1][col] = 'x'
-                self.lower_total(row+1, col)
-                made_changes = True
-            if row > 0 and self.board[row-1][col] is None:
-                self.board[row-1][col] = '.'
-                made_changes = True
-        elif value in BOTTOM:
-            if self.board[row-1][col] is None:
-                self.board[row-1][col] = 'x'
-                self.lower_total(row-1, col)
-                made_changes = True
-            if row < self.rows-1 and self.board[row+1][col] is None:
-                self.board[row+1][col] = '.'
-                made_changes = True
-        elif value in LEFT:
-            if self.board[row][col+1] is None:
-                self.board[row][col+1] = 'x'
-                self.lower_total(row, col+1)
-                made_changes = True
-            if col > 0 and self.board[row][col-1] is None:
-                self.board[row][col-1] = '.'
-                made_changes = True
-        elif value in RIGHT:
-            if self.board[row][col-1] is None:
-                self.board[row][col-1] = 'x'
-                self.lower_total(row, col-1)
-                made_changes = True
-            if col < self.cols-1 and self.board[row][col+1] is None:
-                self.board[row][col+1] = '.'
-                made_changes = True
-        elif value in MIDDLE:
+        for diagonal in (pos - width - 1, pos - width + 1, pos + width - 1, pos + width + 1):
+            made_changes |= self._fill_water(diagonal)
+        shape = SHAPES[value]
+        if shape == 't':
+            made_changes |= self._fill_ship(pos + width)
+            made_changes |= self._fill_water(pos - width)
+        elif shape == 'b':
+            made_changes |= self._fill_ship(pos - width)
+            made_changes |= self._fill_water(pos + width)
+        elif shape == 'l':
+            made_changes |= self._fill_ship(pos + 1)
+            made_changes |= self._fill_water(pos - 1)
+        elif shape == 'r':
+            made_changes |= self._fill_ship(pos - 1)
+            made_changes |= self._fill_water(pos + 1)
+        elif shape == 'm':
             # Horizontal
-            if row == 0 or row == self.rows-1 or self.board[row-1][col] in ('.', 'W') or self.board[row+1][col] in ('.', 'W'):
-                if self.board[row][col-1] is None:
-                    self.board[row][col-1] = 'x'
-                    self.lower_total(row, col-1)
-                    made_changes = True
-                if self.board[row][col+1] is None:
-                    self.board[row][col+1] = 'x'
-                    self.lower_total(row, col+1)
-                    made_changes = True
+            if IS_CLOSED[cells[pos - width]] or IS_CLOSED[cells[pos + width]]:
+                made_changes |= self._fill_ship(pos - 1)
+                made_changes |= self._fill_ship(pos + 1)
             # Vertical
-            elif col == 0 or col == self.cols-1 or self.board[row][col-1] in ('.', 'W') or self.board[row][col+1] in ('.', 'W'):
-                if self.board[row-1][col] is None:
-                    self.board[row-1][col] = 'x'
-                    self.lower_total(row-1, col)
-                    made_changes = True
-                if self.board[row+1][col] is None:
-                    self.board[row+1][col] = 'x'
-                    self.lower_total(row+1, col)
-                    made_changes = True
-        elif value in CIRCLE:
-            if row > 0 and self.board[row-1][col] is None:
-                self.board[row-1][col] = '.'
-                made_changes = True
-            if row < self.rows-1 and self.board[row+1][col] is None:
-                self.board[row+1][col] = '.'
-                made_changes = True
-            if col > 0 and self.board[row][col-1] is None:
-                self.board[row][col-1] = '.'
-                made_changes = True
-            if col < self.cols-1 and self.board[row][col+1] is None:
-                self.board[row][col+1] = '.'
-                made_changes = True
+            elif IS_CLOSED[cells[pos - 1]] or IS_CLOSED[cells[pos + 1]]:
+                made_changes |= self._fill_ship(pos - width)
+                made_changes |= self._fill_ship(pos + width)
+        elif shape == 'c':
+            for neighbour in (pos - width, pos + width, pos - 1, pos + 1):
+                made_changes |= self._fill_water(neighbour)
         return made_changes
 
+    def _can_be_ship(self, pos: int) -> bool:
+        """Verifica se a célula vazia pode ser uma peça de barco, dadas as vizinhas."""
+        cells, width = self.cells, self.width
+        return SHIP_RIGHT[cells[pos + 1]] and SHIP_LEFT[cells[pos - 1]] \
+            and SHIP_BELOW[cells[pos + width]] and SHIP_ABOVE[cells[pos - width]] \
+            and IS_EMPTY[cells[pos + width + 1]] and IS_EMPTY[cells[pos + width - 1]] \
+            and IS_EMPTY[cells[pos - width + 1]] and IS_EMPTY[cells[pos - width - 1]]
+
+    def _fill_line(self, total: int, unknown: int, positions) -> bool:
+        """Preenche a linha (ou coluna) com água se o total já foi atingido, ou com placeholders
+        se o número de células vazias é igual ao total. Devolve False se a linha é impossível."""
+        if total < 0 or unknown < total:
+            return False
+        if unknown == 0 or (total != 0 and unknown != total):
+            return True
+        cells = self.cells
+        empty = [pos for pos in positions if cells[pos] == UNKNOWN]
+        if total == 0:
+            for pos in empty:
+                self._write(pos, WATER)
+        elif len(empty) == total:
+            for pos in empty:
+                if cells[pos] == UNKNOWN:
+                    if not self._can_be_ship(pos):
+                        return False
+                    self._fill_ship(pos)
+                    self.fill_pos_water(pos, PLACEHOLDER)
+        return True
+
+    def propagate(self) -> bool:
+        """Aplica as regras de preenchimento às células, linhas e colunas alteradas desde a última
+        propagação, até não haver mais nada por rever. Devolve False se o tabuleiro é impossível."""
+        cells, rows, cols = self.dirty_cells, self.dirty_rows, self.dirty_cols
+        grid, width = self.cells, self.width
+        while cells or rows or cols:
+            while cells:
+                pos = cells.pop()
+                value = grid[pos]
+                if value == UNKNOWN:
+                    row, col = divmod(pos - 1, width)
+                    if self.row_remaining[row - 1] == 0 or self.col_remaining[col] == 0:
+                        self._write(pos, WATER)
+                elif IS_SHIP[value]:
+                    self.fill_pos_water(pos, value)
+            if rows:
+                row = rows.pop()
+                start = self.position(row, 0)
+                possible = self._fill_line(self.row_remaining[row], self.row_unknown[row], range(start, start + self.cols))
+            else:
+                col = cols.pop()
+                possible = self._fill_line(self.col_remaining[col], self.col_unknown[col],
+                                           range(self.position(0, col), self.position(self.rows, col), width))
+            if not possible:
+                self._set_attr('impossible', True)
+                cells.clear()
+                rows.clear()
+                cols.clear()
+                self.changed.clear()
+                return False
+        return True
+
     def fill_board_water(self):
-        """Preenche os espaços vazios que são necessáriamente água até não haver mais mudanças."""
-        made_changes = True
-        while (made_changes):
-            made_changes = False
-            for row in range(self.rows):
-                for col in range(self.cols):
-                    if (self.get_row_total(row) == 0 or self.get_col_total(col) == 0) and self.get_value(row, col) is None:
-                        self.set_value(row, col, '.')
-                        made_changes = True
-                    elif self.get_value(row, col) not in EMPTY_SPACE:
-                        made_changes = made_changes or self.fill_pos_water(row, col, self.get_value(row, col))
-                    elif self.get_row_total(row) < 0 or self.get_col_total(col) < 0:
-                        self.impossible = True
-                        return
+        """Preenche os espaços vazios que são necessáriamente água até não haver mais mudanças.
+        Só são revistas as células, linhas e colunas afetadas por alterações desde a última vez."""
+        if self.propagate():
+            self.complete_unknown(self.changed_starts())
 
-            for row in range(self.rows):
-                empty_cols = 0
-                for col in range(self.cols):
-                    if self.get_value(row, col) is None:
-                        empty_cols += 1
-                if empty_cols == self.get_row_total(row):
-                    for col in range(self.cols):
-                        if self.get_value(row, col) is None:
-                            if not self.get_value(row, col+1) in (['x'] + EMPTY_SPACE + MIDDLE + RIGHT) or not self.get_value(row, col-1) in (['x'] + EMPTY_SPACE + MIDDLE + LEFT) \
-                            or not self.get_value(row+1, col) in (['x'] + EMPTY_SPACE + MIDDLE + BOTTOM) or not self.get_value(row-1, col) in (['x'] + EMPTY_SPACE + MIDDLE + TOP) \
-                            or not self.get_value(row+1, col+1) in EMPTY_SPACE or not self.get_value(row+1, col-1) in EMPTY_SPACE or not self.get_value(row-1, col+1) in EMPTY_SPACE or not self.get_value(row-1, col-1) in EMPTY_SPACE:
-                                self.impossible = True
-                                return
-                            self.set_value(row, col, 'x')
-                            self.lower_total(row, col)
-                            self.fill_pos_water(row, col, 'x')
-                            made_changes = True
+    def changed_starts(self) -> set or None:
+        """Devolve as posições onde pode começar um barco afetado pelas células alteradas
+        desde a última chamada, e esquece essas alterações. Devolve None (todas as células)
+        quando todas foram alteradas, como num tabuleiro acabado de criar."""
+        if len(self.changed) == self.rows * self.cols:
+            self.changed.clear()
+            return None
+        width, max_size = self.width, self.max_size
+        starts = set()
+        for pos in self.changed:
+            row, col = self.cell(pos)
+            if row < self.rows - 1:
+                starts.add(pos + width)
+            if col < self.cols - 1:
+                starts.add(pos + 1)
+            starts.update(pos - i for i in range(min(col, max_size) + 1))
+            starts.update(pos - i * width for i in range(min(row, max_size) + 1))
+        self.changed.clear()
+        return starts
 
-            for col in range(self.cols):
-                empty_rows = 0
-                for row in range(self.rows):
-                    if self.get_value(row, col) is None:
-                        empty_rows += 1
-                if empty_rows == self.get_col_total(col):
-                    for row in range(self.rows):
-                        if self.get_value(row, col) is None:
-                            if not self.get_value(row, col+1) in (['x'] + EMPTY_SPACE + MIDDLE + RIGHT) or not self.get_value(row, col-1) in (['x'] + EMPTY_SPACE + MIDDLE + LEFT) \
-                            or not self.get_value(row+1, col) in (['x'] + EMPTY_SPACE + MIDDLE + BOTTOM) or not self.get_value(row-1, col) in (['x'] + EMPTY_SPACE + MIDDLE + TOP) \
-                            or not self.get_value(row+1, col+1) in EMPTY_SPACE or not self.get_value(row+1, col-1) in EMPTY_SPACE or not self.get_value(row-1, col+1) in EMPTY_SPACE or not self.get_value(row-1, col-1) in EMPTY_SPACE:
-                                self.impossible = True
-                                return
-                            self.set_value(row, col, 'x')
-                            self.lower_total(row, col)
-                            self.fill_pos_water(row, col, 'x')
-                            made_changes = True
-        self.complete_unknown()
-
-    def complete_unknown(self):
-        """Tenta descobrir se os placeholders conseguem completar um barco."""
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.get_value(row, col) == 'x' and (row == 0 or self.get_value(row-1, col) in ('.', 'W')) \
-                and (col == 0 or self.get_value(row, col-1) in ('.', 'W')):
-                    # Circle
-                    if (row == self.rows-1 or self.get_value(row+1, col) in ('.', 'W')) \
-                    and (col == self.cols-1 or self.get_value(row, col+1) in ('.', 'W')):
-                        self.set_value(row, col, 'c')
-                        self.num_submarines -= 1
-                        continue
-                    # Horizontal
-                    size, is_boat = 1, False
-                    for i in range(1, 5):
-                        if self.get_value(row, col+i) in (['x'] + RIGHT + MIDDLE):
-                            size += 1
-                        elif self.get_value(row, col+i) in ['.', 'W']:
-                            is_boat = True
-                            break
-                        else:
-                            break
-                    if is_boat:
-                        if size == 4:
-                            self.apply_action((row, col, 'lmmr', 'h'))
-                        elif size == 3:
-                            self.apply_action((row, col, 'lmr', 'h'))
-                        elif size == 2:
-                            self.apply_action((row, col, 'lr', 'h'))
-                    # Vertical
-                    size, is_boat = 1, False
-                    for i in range(1, 5):
-                        if self.get_value(row+i, col) in (['x'] + BOTTOM + MIDDLE):
-                            size += 1
-                        elif self.get_value(row+i, col) == '.':
-                            is_boat = True
-                            break
-                        else:
-                            break
-                    if is_boat:
-                        if size == 4:
-                            self.apply_action((row, col, 'tmmb', 'v'))
-                        elif size == 3:
-                            self.apply_action((row, col, 'tmb', 'v'))
-                        elif size == 2:
-                            self.apply_action((row, col, 'tb', 'v'))
-                elif self.get_value(row, col) == 'L':
-                    size, is_boat, already_complete = 1, False, True
-                    for i in range(1, 5):
-                        if self.get_value(row, col+i) in (['x'] + RIGHT + MIDDLE):
-                            size += 1
-                            if self.get_value(row, col+i) != 'x':
-                                already_complete = False
-                        elif self.get_value(row, col+i) == '.':
-                            is_boat = True
-                            break
-                        else:
-                            break
-                    if is_boat and not already_complete:
-                        if size == 4:
-                            self.apply_action((row, col, 'lmmr', 'h'))
-                        elif size == 3:
-                            self.apply_action((row, col, 'lmr', 'h'))
-                        elif size == 2:
-                            self.apply_action((row, col, 'lr', 'h'))
-                elif self.get_value(row, col) == 'T':
-                    size, is_boat, already_complete = 1, False, True
-                    for i in range(1, 5):
-                        if self.get_value(row+i, col) in (['x'] + BOTTOM + MIDDLE):
-                            size += 1
-                            if self.get_value(row+i, col) != 'x':
-                                already_complete = False
-                        elif self.get_value(row+i, col) == '.':
-                            is_boat = True
-                            break
-                        else:
-                            break
-                    if is_boat and not already_complete:
-                        if size == 4:
-                            self.apply_action((row, col, 'tmmb', 'v'))
-                        elif size == 3:
-                            self.apply_action((row, col, 'tmb', 'v'))
-                        elif size == 2:
-                            self.apply_action((row, col, 'tb', 'v'))
-                    
+    def _run(self, pos: int, step: int, extends: bytes, ends: bytes) -> tuple:
+        """Segue as peças que podem continuar um barco a partir de pos (step 1 para a direita,
+        width para baixo) e devolve (tamanho, se acaba numa célula de ends, se todas as peças
+        seguidas são placeholders)."""
+        cells = self.cells
+        size, only_placeholders = 1, True
+        for i in range(1, self.max_size + 1):
+            value = cells[pos + i * step]
+            if extends[value]:
+                size += 1
+                if value != PLACEHOLDER:
+                    only_placeholders = False
+            else:
+                return size, bool(ends[value]), only_placeholders
+        return size, False, only_placeholders
+
+    def complete_unknown(self, starts=None):
+        """Tenta descobrir se os placeholders conseguem completar um barco.
+        Se starts for dado, só são consideradas as posições onde pode começar um barco nesse conjunto."""
+        cells, width = self.cells, self.width
+        if starts is None:
+            positions = [self.position(row, col) for row in range(self.rows) for col in range(self.cols)]
+        else:
+            positions = sorted(starts)
+        for pos in positions:
+            value = cells[pos]
+            if value == PLACEHOLDER and IS_CLOSED[cells[pos - width]] and IS_CLOSED[cells[pos - 1]]:
+                # Circle
+                row, col = self.cell(pos)
+                if IS_CLOSED[cells[pos + width]] and IS_CLOSED[cells[pos + 1]]:
+                    self._write(pos, CODES['c'])
+                    self.count_placement((row, col, ship_move(1, 'h'), 'h'))
+                    continue
+                # Horizontal
+                size, is_boat, _ = self._run(pos, 1, IN_ROW_RUN, IS_WATER)
+                if is_boat and size > 1:
+                    self.apply_action((row, col, ship_move(size, 'h'), 'h'))
+                # Vertical
+                size, is_boat, _ = self._run(pos, width, IN_COL_RUN, IS_DOT)
+                if is_boat and size > 1:
+                    self.apply_action((row, col, ship_move(size, 'v'), 'v'))
+            elif value == CODES['L']:
+                size, is_boat, already_complete = self._run(pos, 1, IN_ROW_RUN, IS_DOT)
+                if is_boat and not already_complete and size > 1:
+                    self.apply_action(self.cell(pos) + (ship_move(size, 'h'), 'h'))
+            elif value == CODES['T']:
+                size, is_boat, already_complete = self._run(pos, width, IN_COL_RUN, IS_DOT)
+                if is_boat and not already_complete and size > 1:
+                    self.apply_action(self.cell(pos) + (ship_move(size, 'v'), 'v'))
+
+    def remaining_fleet(self) -> dict:
+        """Devolve o número de barcos de cada tamanho que falta colocar."""
+        return {size: self.remaining[size] for size in self.fleet}
+
+    def ships_left(self) -> int:
+        """Devolve o número total de barcos que falta colocar."""
+        return sum(self.remaining)
+
+    def unresolved(self) -> tuple or None:
+        """Devolve (células por preencher, peças de barco em falta somadas pelas linhas e colunas),
+        ou None se alguma linha ou coluna já não consegue atingir o seu total."""
+        for remaining, unknown in zip(self.row_remaining + self.col_remaining, self.row_unknown + self.col_unknown):
+            if remaining < 0 or remaining > unknown:
+                return None
+        return sum(self.row_unknown), sum(self.row_remaining) + sum(self.col_remaining)
+
+    def _cells_with(self, value: int) -> list:
+        """Devolve as células (row, col) com o código dado, linha a linha."""
+        cells, width = self.cells, self.width
+        return [(row, col) for row in range(self.rows) for col in range(self.cols)
+                if cells[(row + 1) * width + col + 1] == value]
+
+    def open_cells(self) -> list:
+        """Devolve as células de barco que ainda não pertencem a um barco contado."""
+        return self._cells_with(PLACEHOLDER)
+
+    def unknown_cells(self) -> list:
+        """Devolve as células por preencher."""
+        return self._cells_with(UNKNOWN)
 
     def possible_actions(self) -> list:
-        """Devolve uma lista de ações possíveis."""
+        """Devolve uma lista de ações possíveis.
+        Os barcos do mesmo tamanho são colocados por ordem canónica: só são consideradas as
+        posições depois da do último barco desse tamanho colocado com place_ship(), e os ramos
+        em que a propagação completa um barco antes dessa posição são cortados (ver
+        count_placement), para que cada frota seja alcançada uma única vez."""
+        remaining = self.remaining
+        for size in range(self.max_size, 0, -1):
+            if remaining[size] > 0:
+                return self.legal_placements(size, self.last_placement[size] + 1)
+        return []
+
+    def legal_placements(self, size: int, start: int = 0) -> list:
+        """Devolve as ações legais para um barco de tamanho size, a partir da posição start
+        do índice de posições."""
+        grid = self.cells
+        empty = IS_EMPTY
         actions = []
-        for row in range(self.rows):
-            for col in range(self.cols):
-                if self.num_battleships > 0:
-                    if row < self.rows-3:
-                        can_fit = True
-                        n_marked, n_placed = 0, 0
-                        if (row == 0 or self.get_value(row-1, col) in EMPTY_SPACE) and self.get_value(row, col) in (['x', None] + TOP) \
-                        and self.get_value(row+1, col) in (['x', None] + MIDDLE) and self.get_value(row+2, col) in (['x', None] + MIDDLE) \
-                        and self.get_value(row+3, col) in (['x', None] + BOTTOM) and (row == self.rows-4 or self.get_value(row+4, col) in EMPTY_SPACE):
-                            for i in range(4):
-                                if self.get_value(row+i, col) == 'x':
-                                    n_marked += 1
-                                elif self.get_value(row+i, col) in (TOP + MIDDLE + BOTTOM):
-                                    n_placed += 1
-                                elif self.get_row_total(row+i) < 1:
-                                    can_fit = False
-                                    break
-                            if n_placed != 4 and self.get_col_total(col) >= (4 - n_marked - n_placed) and can_fit:
-                                actions.append((row, col, 'tmmb', 'v'))
-                    if col < self.cols-3:
-                        can_fit = True
-                        n_marked, n_placed = 0, 0
-                        if (col == 0 or self.get_value(row, col-1) in EMPTY_SPACE) and self.get_value(row, col) in (['x', None] + LEFT) \
-                        and self.get_value(row, col+1) in (['x', None] + MIDDLE) and self.get_value(row, col+2) in (['x', None] + MIDDLE) \
-                        and self.get_value(row, col+3) in (['x', None] + RIGHT) and (col == self.cols-4 or self.get_value(row, col+4) in EMPTY_SPACE):
-                            for i in range(4):
-                                if self.get_value(row, col+i) == 'x':
-                                    n_marked += 1
-                                elif self.get_value(row, col+i) in (LEFT + MIDDLE + RIGHT):
-                                    n_placed += 1
-                                elif self.get_col_total(col+i) < 1:
-                                    can_fit = False
-                                    break
-                            if n_placed != 4 and self.get_row_total(row) >= (4 - n_marked - n_placed) and can_fit:
-                                actions.append((row, col, 'lmmr', 'h'))
-                elif self.num_cruisers > 0:
-                    if row < self.rows-2:
-                        can_fit = True
-                        n_marked, n_placed = 0, 0
-                        if (row == 0 or self.get_value(row-1, col) in EMPTY_SPACE) and self.get_value(row, col) in (['x', None] + TOP) \
-                        and self.get_value(row+1, col) in (['x', None] + MIDDLE) and self.get_value(row+2, col) in (['x', None] + BOTTOM) \
-                        and (row == self.rows-3 or self.get_value(row+3, col) in EMPTY_SPACE):
-                            for i in range(3):
-                                if self.get_value(row+i, col) == 'x':
-                                    n_marked += 1
-                                elif self.get_value(row+i, col) in (TOP + MIDDLE + BOTTOM):
-                                    n_placed += 1
-                                elif self.get_row_total(row+i) < 1:
-                                    can_fit = False
-                                    break
-                            if n_placed != 3 and self.get_col_total(col) >= (3 - n_marked - n_placed) and can_fit:
-                                actions.append((row, col, 'tmb', 'v'))
-                    if col < self.cols-2:
-                        can_fit = True
-                        n_marked, n_placed = 0, 0
-                        if (col == 0 or self.get_value(row, col-1) in EMPTY_SPACE) and self.get_value(row, col) in (['x', None] + LEFT) \
-                        and self.get_value(row, col+1) in (['x', None] + MIDDLE) and self.get_value(row, col+2) in (['x', None] + RIGHT) \
-                        and (col == self.cols-3 or self.get_value(row, col+3) in EMPTY_SPACE):
-                            for i in range(3):
-                                if self.get_value(row, col+i) == 'x':
-                                    n_marked += 1
-                                elif self.get_value(row, col+i) in (LEFT + MIDDLE + RIGHT):
-                                    n_placed += 1
-                                elif self.get_col_total(col+i) < 1:
-                                    can_fit = False
-                                    break
-                            if n_placed != 3 and self.get_row_total(row) >= (3 - n_marked - n_placed) and can_fit:
-                                actions.append((row, col, 'lmr', 'h'))
-                elif self.num_destroyers > 0:
-                    if row < self.rows-1:
-                        can_fit = True
-                        n_marked, n_placed = 0, 0
-                        if (row == 0 or self.get_value(row-1, col) in EMPTY_SPACE) and self.get_value(row, col) in (['x', None] + TOP) \
-                        and self.get_value(row+1, col) in (['x', None] + BOTTOM) and (row == self.rows-2 or self.get_value(row+2, col) in EMPTY_SPACE):
-                            for i in range(2):
-                                if self.get_value(row+i, col) == 'x':
-                                    n_marked += 1
-                                elif self.get_value(row+i, col) in (TOP + BOTTOM):
-                                    n_placed += 1
-                                elif self.get_row_total(row+i) < 1:
-                                    can_fit = False
-                                    break
-                            if n_placed != 2 and self.get_col_total(col) >= (2 - n_marked - n_placed) and can_fit:
-                                actions.append((row, col, 'tb', 'v'))
-                    if col < self.cols-1:
-                        can_fit = True
-                        n_marked, n_placed = 0, 0
-                        if (col == 0 or self.get_value(row, col-1) in EMPTY_SPACE) and self.get_value(row, col) in (['x', None] + LEFT) \
-                        and self.get_value(row, col+1) in (['x', None] + RIGHT) and (col == self.cols-2 or self.get_value(row, col+2) in EMPTY_SPACE):
-                            for i in range(2):
-                                if self.get_value(row, col+i) == 'x':
-                                    n_marked += 1
-                                elif self.get_value(row, col+i) in (LEFT + RIGHT):
-                                    n_placed += 1
-                                elif self.get_col_total(col+i) < 1:
-                                    can_fit = False
-                                    break
-                            if n_placed != 2 and self.get_row_total(row) >= (2 - n_marked - n_placed) and can_fit:
-                                actions.append((row, col, 'lr', 'h'))
-                elif self.num_submarines > 0:
-                    if (self.get_value(row, col) == 'x' or (self.get_value(row, col) is None \
-                    and self.get_row_total(row) >= 1 and self.get_col_total(col) >= 1)) \
-                    and (row == self.rows-1 or self.get_value(row+1, col) in EMPTY_SPACE) \
-                    and (col == self.cols-1 or self.get_value(row, col+1) in EMPTY_SPACE) \
-                    and (row == 0 or self.get_value(row-1, col) in EMPTY_SPACE) \
-                    and (col == 0 or self.get_value(row, col-1) in EMPTY_SPACE):
-                        actions.append((row, col, 'c', 'h'))
+        for action, cells, ends in board_placements(self.rows, self.cols, size)[start:]:
+            for pos in ends:
+                if not empty[grid[pos]]:
+                    break
+            else:
+                row, col, _, orientation = action
+                if size == 1:
+                    value = grid[cells[0][0]]
+                    if value == PLACEHOLDER or (value == UNKNOWN and self.row_remaining[row] >= 1 and self.col_remaining[col] >= 1):
+                        actions.append(action)
+                    continue
+                if orientation == 'v':
+                    cross_remaining, line_remaining = self.row_remaining, self.col_remaining[col]
+                else:
+                    cross_remaining, line_remaining = self.col_remaining, self.row_remaining[row]
+                n_marked, n_placed = 0, 0
+                for pos, allowed, cross in cells:
+                    value = grid[pos]
+                    if not allowed[value]:
+                        break
+                    if value == PLACEHOLDER:
+                        n_marked += 1
+                    elif value != UNKNOWN:
+                        n_placed += 1
+                    elif cross_remaining[cross] < 1:
+                        break
+                else:
+                    if n_placed != size and line_remaining >= (size - n_marked - n_placed):
+                        actions.append(action)
         return actions
 
+    def place_ship(self, action: tuple):
+        """Aplica uma ação escolhida na procura, registando a sua posição para a ordem canónica."""
+        self._set_item(self.last_placement, len(action[2]), placement_position(self.rows, self.cols, action))
+        self.apply_action(action)
+
     def apply_action(self, action: tuple):
         """Aplica a ação ao tabuleiro."""
         row, col, move, orientation = action
+        cells = self.cells
+        pos = self.position(row, col)
+        step = 1 if orientation == 'h' else self.width
         changed = False
-        for i in move:
-            if orientation == 'h':
-                old_value = self.get_value(row, col)
-                if old_value is None:
-                    self.lower_total(row, col)
-                self.set_value(row, col, i)
-                if old_value != self.get_value(row, col):
-                    changed = True
-                col += 1
-            elif orientation == 'v':
-                old_value = self.get_value(row, col)
-                if old_value is None:
-                    self.lower_total(row, col)
-                self.set_value(row, col, i)
-                if old_value != self.get_value(row, col):
-                    changed = True
-                row += 1
+        for i, piece in enumerate(move):
+            old_value = cells[pos]
+            if old_value == UNKNOWN:
+                if orientation == 'h':
+                    self.lower_total(row, col + i)
+                else:
+                    self.lower_total(row + i, col)
+            if not IS_HINT[old_value]:
+                self._write(pos, CODES[piece])
+            if old_value != cells[pos]:
+                changed = True
+            pos += step
         if changed:
-            if len(move) == 4:
-                self.num_battleships -= 1
-            elif len(move) == 3:
-                self.num_cruisers -= 1
-            elif len(move) == 2:
-                self.num_destroyers -= 1
-            elif len(move) == 1:
-                self.num_submarines -= 1
+            self.count_placement(action)
             self.fill_board_water()
 
     @staticmethod
@@ -502,47 +887,615 @@ class Board:
         Por exemplo:
             $ python3 bimaru.py < input_T01
 
-            > from sys import stdin
-            > line = stdin.readline().split()
-        """
-        rows = from_input.readline().split()[1:]
-        cols = from_input.readline().split()[1:]
-        n_rows = len(rows)
-        n_cols = len(cols)
-        board = Board(n_rows, n_cols)
+        A linha FLEET, entre COLUMN e o número de pistas, é opcional (ver parse_fleet).
+        Se o ficheiro tiver várias instâncias, devolve a primeira (ver parse_instances)."""
+        for board in Board.parse_instances(from_input):
+            return board
+        raise ValueError("não há nenhuma instância para ler")
 
+    @staticmethod
+    def parse_instances(from_input=sys.stdin):
+        """Gera um tabuleiro por cada instância do ficheiro (ver read_instances)."""
+        for row_totals, col_totals, fleet, hints in read_instances(from_input):
+            yield Board.from_instance(row_totals, col_totals, fleet, hints)
+
+    @staticmethod
+    def from_instance(row_totals: list, col_totals: list, fleet: dict, hints: list) -> 'Board':
+        """Constrói o tabuleiro a partir dos campos de uma instância lida por parse_tokens."""
+        board = Board(len(row_totals), len(col_totals), fleet)
         # Para guardar os valores do número de navios que podem estar na linha e coluna
-        for row in range(n_rows):
-            board.set_value(row, n_cols, rows[row])
-        for col in range(n_cols):
-            board.set_value(n_rows, col, cols[col])
-
-        n_hints = eval(from_input.readline())
-        hints = []
-        for _ in range(n_hints):
-            hint = from_input.readline().split()[1:]
-            board.set_value(int(hint[0]), int(hint[1]), hint[2])
-            if hint[2] != 'W':
-                hints.append((int(hint[0]), int(hint[1]), hint[2]))
-                board.lower_total(int(hint[0]), int(hint[1]))
-
-        board.remove_complete_hints(hints)
+        board.row_remaining, board.col_remaining = list(row_totals), list(col_totals)
+        ship_hints = []
+        for row, col, piece in hints:
+            board.set_value(row, col, piece)
+            if piece != 'W':
+                ship_hints.append((row, col, piece))
+                board.lower_total(row, col)
+        board.remove_complete_hints(ship_hints)
         board.fill_board_water()
         return board
 
-    def print_board(self):
-        """Imprime o tabuleiro no standard output (stdout)."""
+    def render_bytes(self) -> bytes:
+        """Devolve o texto que print_board() imprime, em bytes: as linhas da grelha são uma só fatia
+        de self.cells, traduzida com OUTPUT_TABLE. Cada linha acaba no limite, que passa a mudança
+        de linha; as células por preencher aparecem como '?'."""
+        width = self.width
+        return bytes(self.cells[width + 1:(self.rows + 1) * width + 1].translate(OUTPUT_TABLE))
+
+    def render(self) -> str:
+        """Devolve o texto que print_board() imprime."""
+        return self.render_bytes().decode('ascii')
+
+    def print_board(self, out=None):
+        """Imprime o tabuleiro no standard output (stdout), ou em out, com uma só escrita."""
+        write_output((self.render_bytes(),), out)
+
+####################################################################################################
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(x: int) -> int:
+        return bin(x).count('1')
+
+
+class BitBoard(Trail):
+    """Representação alternativa do tabuleiro com máscaras de bits.
+
+    Cada linha e cada coluna é guardada como um inteiro por categoria (barco, água e pistas por
+    tipo de peça), em que o bit i corresponde à coluna (ou linha) i. A legalidade das ações, a
+    água nas diagonais e os totais das linhas e colunas passam a ser deslocamentos, ANDs e
+    popcounts, e copy() só copia quatro listas de inteiros."""
+    impossible = False
+
+    def __init__(self, rows: int, cols: int, fleet: dict = None):
+        """Construtor: recebe o número de linhas e colunas do tabuleiro e a frota."""
+        self.rows = rows
+        self.cols = cols
+        self.full_row = (1 << cols) - 1
+        self.full_col = (1 << rows) - 1
+        self.ship_r = [0] * rows
+        self.water_r = [0] * rows
+        self.ship_c = [0] * cols
+        self.water_c = [0] * cols
+        # Valores estáticos, partilhados entre cópias
+        self.row_totals = [0] * rows
+        self.col_totals = [0] * cols
+        self.hints_r = {piece: [0] * rows for piece in 'TBLRMCW'}
+        self.hints_c = {piece: [0] * cols for piece in 'TBLRMCW'}
+        self.fleet = dict(fleet or FLEET)
+        self.remaining = dict(self.fleet)
+        self.last_placement = [-1] * (max(self.fleet) + 1)
+        # Barcos completos no tabuleiro, como (tamanho, posição no índice)
+        self.completed = frozenset()
+        # Hash de Zobrist das células com barco ('x') ou água ('.'), atualizado em cada escrita
+        self.zobrist = 0
+
+    def _set_bits(self, lines: list, cross_lines: list, index: int, new: int):
+        """Liga os bits new na linha (ou coluna) index e os bits correspondentes na
+        representação perpendicular, guardando os valores antigos no trail se estiver ativo."""
+        trail = self.trail
+        if trail is not None:
+            trail.append((lines, index, lines[index]))
+        lines[index] |= new
+        bit = 1 << index
+        value = 'x' if lines is self.ship_r or lines is self.ship_c else '.'
+        by_row = lines is self.ship_r or lines is self.water_r
+        zobrist = self.zobrist
+        while new:
+            low = new & -new
+            cross = low.bit_length() - 1
+            if trail is not None:
+                trail.append((cross_lines, cross, cross_lines[cross]))
+            cross_lines[cross] |= bit
+            zobrist ^= zobrist_key(index, cross, value) if by_row else zobrist_key(cross, index, value)
+            new ^= low
+        self._set_attr('zobrist', zobrist)
+
+    def fleet_key(self) -> tuple:
+        """Devolve a frota que falta colocar, a posição do último barco de cada tamanho e se o
+        tabuleiro é impossível (o que pode depender do caminho, ver _count_ships)."""
+        return tuple(sorted(self.remaining.items())), tuple(self.last_placement), self.impossible
+
+    def key(self) -> tuple:
+        """Devolve uma chave imutável que identifica o tabuleiro para a procura."""
+        return tuple(self.ship_r), tuple(self.water_r), self.fleet_key()
+
+    def __hash__(self):
+        return hash((self.zobrist, self.fleet_key()))
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.zobrist == other.zobrist and self.ship_r == other.ship_r \
+            and self.water_r == other.water_r and self.fleet_key() == other.fleet_key()
+
+    def _add_ship(self, row: int, mask: int) -> bool:
+        """Marca como barco as células da máscara na linha. Devolve True se houve mudanças."""
+        new = mask & ~self.ship_r[row]
+        if not new:
+            return False
+        if new & self.water_r[row]:
+            self._set_attr('impossible', True)
+            return False
+        self._set_bits(self.ship_r, self.ship_c, row, new)
+        return True
+
+    def _add_water(self, row: int, mask: int) -> bool:
+        """Marca como água as células da máscara na linha. Devolve True se houve mudanças."""
+        new = mask & ~self.water_r[row]
+        if not new:
+            return False
+        if new & self.ship_r[row]:
+            self._set_attr('impossible', True)
+            return False
+        self._set_bits(self.water_r, self.water_c, row, new)
+        return True
+
+    def _add_ship_col(self, col: int, mask: int) -> bool:
+        """Marca como barco as células da máscara na coluna. Devolve True se houve mudanças."""
+        new = mask & ~self.ship_c[col]
+        if not new:
+            return False
+        if new & self.water_c[col]:
+            self._set_attr('impossible', True)
+            return False
+        self._set_bits(self.ship_c, self.ship_r, col, new)
+        return True
+
+    def _add_water_col(self, col: int, mask: int) -> bool:
+        """Marca como água as células da máscara na coluna. Devolve True se houve mudanças."""
+        new = mask & ~self.water_c[col]
+        if not new:
+            return False
+        if new & self.ship_c[col]:
+            self._set_attr('impossible', True)
+            return False
+        self._set_bits(self.water_c, self.water_r, col, new)
+        return True
+
+    def get_value(self, row: int, col: int) -> str or None:
+        """Devolve o valor na respetiva posição do tabuleiro, no formato de Board."""
+        if row < 0 or row >= self.rows or col < 0 or col >= self.cols:
+            return None
+        bit = 1 << col
+        if self.water_r[row] & bit:
+            return 'W' if self.hints_r['W'][row] & bit else '.'
+        if not self.ship_r[row] & bit:
+            return None
+        for piece in 'TBLRMC':
+            if self.hints_r[piece][row] & bit:
+                return piece
+        up = row > 0 and self.ship_r[row-1] & bit
+        down = row < self.rows-1 and self.ship_r[row+1] & bit
+        left = self.ship_r[row] & (bit >> 1)
+        right = self.ship_r[row] & (bit << 1)
+        if (up or down) and (left or right):
+            return 'x'
+        if (up and down) or (left and right):
+            return 'm'
+        if down:
+            return 't'
+        if up:
+            return 'b'
+        if right:
+            return 'l'
+        if left:
+            return 'r'
+        closed = (row == 0 or self.water_r[row-1] & bit) and (row == self.rows-1 or self.water_r[row+1] & bit) \
+            and (col == 0 or self.water_r[row] & (bit >> 1)) and (col == self.cols-1 or self.water_r[row] & (bit << 1))
+        return 'c' if closed else 'x'
+
+    def get_row_total(self, row: int) -> int:
+        """Devolve o número de peças de barco que faltam colocar na linha."""
+        return self.row_totals[row] - popcount(self.ship_r[row])
+
+    def get_col_total(self, col: int) -> int:
+        """Devolve o número de peças de barco que faltam colocar na coluna."""
+        return self.col_totals[col] - popcount(self.ship_c[col])
+
+    def is_full(self) -> bool:
+        """Verifica se todas as células estão preenchidas e todos os totais atingidos."""
+        return all((self.ship_r[row] | self.water_r[row]) == self.full_row and self.get_row_total(row) == 0 for row in range(self.rows)) \
+            and all(self.get_col_total(col) == 0 for col in range(self.cols))
+
+    def copy(self) -> 'BitBoard':
+        """Devolve uma cópia do tabuleiro. Os totais e as pistas são partilhados."""
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.__dict__.update(self.__dict__)
+        new_board.ship_r = self.ship_r[:]
+        new_board.water_r = self.water_r[:]
+        new_board.ship_c = self.ship_c[:]
+        new_board.water_c = self.water_c[:]
+        new_board.remaining = self.remaining.copy()
+        new_board.last_placement = self.last_placement[:]
+        new_board.trail = None
+        return new_board
+
+    def apply_hints(self):
+        """Aplica as implicações estáticas das pistas sobre as células vizinhas."""
+        full = self.full_row
+        last_row, last_col = 1 << (self.rows - 1), 1 << (self.cols - 1)
+        for row in range(self.rows):
+            top, bottom = self.hints_r['T'][row], self.hints_r['B'][row]
+            left, right = self.hints_r['L'][row], self.hints_r['R'][row]
+            circle, middle = self.hints_r['C'][row], self.hints_r['M'][row]
+            self._add_water(row, self.hints_r['W'][row])
+            self._add_ship(row, top | bottom | left | right | circle | middle)
+            if (top and row == self.rows-1) or (bottom and row == 0) or left & last_col or right & 1:
+                self._set_attr('impossible', True)
+                return
+            # Extremidades verticais e submarinos: água dos lados
+            self._add_water(row, (((top | bottom | circle) << 1) | ((top | bottom | circle) >> 1)) & full)
+            # Extremidades horizontais: água em cima e em baixo
+            ends = left | right | circle
+            if row > 0:
+                self._add_ship(row-1, bottom)
+                self._add_water(row-1, top | ends)
+            if row < self.rows-1:
+                self._add_ship(row+1, top)
+                self._add_water(row+1, bottom | ends)
+            self._add_ship(row, ((left << 1) | (right >> 1)) & full)
+            self._add_water(row, ((left >> 1) | (right << 1)) & full)
+            if self.impossible:
+                return
+
+    def _fill_middles(self) -> bool:
+        """Estende as pistas de meio de barco quando a orientação fica determinada."""
+        made_changes = False
+        for row in range(self.rows):
+            middles = self.hints_r['M'][row]
+            while middles:
+                bit = middles & -middles
+                middles ^= bit
+                col = bit.bit_length() - 1
+                vertical_water = row == 0 or row == self.rows-1 or (self.water_r[row-1] | self.water_r[row+1]) & bit
+                horizontal_water = col == 0 or col == self.cols-1 or self.water_r[row] & ((bit << 1) | (bit >> 1))
+                if vertical_water or self.ship_r[row] & ((bit << 1) | (bit >> 1)):
+                    if col == 0 or col == self.cols-1:
+                        self._set_attr('impossible', True)
+                        return False
+                    made_changes |= self._add_ship(row, (bit << 1) | (bit >> 1))
+                if horizontal_water or (row > 0 and self.ship_r[row-1] & bit) or (row < self.rows-1 and self.ship_r[row+1] & bit):
+                    if row == 0 or row == self.rows-1:
+                        self._set_attr('impossible', True)
+                        return False
+                    made_changes |= self._add_ship(row-1, bit)
+                    made_changes |= self._add_ship(row+1, bit)
+        return made_changes
+
+    def _fill_lines(self, ships: list, waters: list, totals: list, full: int, add_ship, add_water) -> bool:
+        """Satura as linhas (ou colunas) cujo total já está atingido ou só pode ser atingido
+        preenchendo todas as células desconhecidas."""
+        made_changes = False
+        for i in range(len(ships)):
+            unknown = full & ~(ships[i] | waters[i])
+            placed = popcount(ships[i])
+            if placed > totals[i] or placed + popcount(unknown) < totals[i]:
+                self._set_attr('impossible', True)
+                return False
+            if unknown:
+                if placed == totals[i]:
+                    made_changes |= add_water(i, unknown)
+                elif placed + popcount(unknown) == totals[i]:
+                    made_changes |= add_ship(i, unknown)
+        return made_changes
+
+    def _runs(self, ships: list, waters: list, full: int):
+        """Percorre as sequências de barco de tamanho >= 2 ao longo das linhas (ou colunas),
+        devolvendo (índice, máscara, tamanho, fechada) em que fechada indica que a sequência
+        tem água ou o limite do tabuleiro nas duas pontas."""
+        for i in range(len(ships)):
+            ship, water = ships[i], waters[i]
+            while ship:
+                low = ship & -ship
+                run = ((ship + low) ^ ship) & ship
+                ship ^= run
+                size = popcount(run)
+                if size > 1:
+                    after = run + low
+                    yield i, run, size, bool((low == 1 or water & (low >> 1)) and (after > full or water & after))
+
+    def _isolated(self, row: int) -> int:
+        """Devolve a máscara das peças de barco da linha rodeadas de água ou limites nas quatro direções."""
+        water = self.water_r[row]
+        isolated = self.ship_r[row] & ((water << 1) | 1) & ((water >> 1) | (1 << (self.cols - 1)))
+        isolated &= self.water_r[row-1] if row > 0 else self.full_row
+        isolated &= self.water_r[row+1] if row < self.rows-1 else self.full_row
+        return isolated
+
+    def _count_runs(self, ships: list, waters: list, full: int, counts: dict, open_runs: list, max_size: int,
+                    completed: list, orientation: str):
+        """Conta os barcos completos de tamanho >= 2 ao longo das linhas (ou colunas, com
+        orientation 'v'), juntando-os a completed como (tamanho, posição no índice), e guarda as
+        sequências ainda abertas como (índice, máscara, tamanho)."""
+        for i, run, size, closed in self._runs(ships, waters, full):
+            if size > max_size:
+                self._set_attr('impossible', True)
+                return
+            if closed:
+                counts[size] = counts.get(size, 0) + 1
+                start = (run & -run).bit_length() - 1
+                row, col = (i, start) if orientation == 'h' else (start, i)
+                completed.append((size, placement_position(self.rows, self.cols, (row, col, ship_move(size, orientation), orientation))))
+            else:
+                open_runs.append((i, run, size))
+
+    def _count_ships(self) -> bool:
+        """Recalcula a frota que falta colocar a partir dos barcos completos no tabuleiro.
+        Fecha com água as sequências que já têm o tamanho do maior barco que ainda as pode
+        completar. Como Board.count_placement, o tabuleiro fica impossível se um barco acabado
+        de completar fica antes do último do mesmo tamanho escolhido com place_ship()."""
+        counts = {}
+        max_size = max(self.fleet)
+        open_rows, open_cols, completed = [], [], []
+        self._count_runs(self.ship_r, self.water_r, self.full_row, counts, open_rows, max_size, completed, 'h')
+        self._count_runs(self.ship_c, self.water_c, self.full_col, counts, open_cols, max_size, completed, 'v')
+        if self.impossible:
+            return False
+        for row in range(self.rows):
+            isolated = self._isolated(row)
+            if isolated:
+                counts[1] = counts.get(1, 0) + popcount(isolated)
+                while isolated:
+                    low = isolated & -isolated
+                    completed.append((1, placement_position(self.rows, self.cols, (row, low.bit_length() - 1, 'c', 'h'))))
+                    isolated ^= low
+        completed = frozenset(completed)
+        last = self.last_placement
+        if any(position < last[size] for size, position in completed - self.completed if size < len(last)):
+            self._set_attr('impossible', True)
+            return False
+        self._set_attr('completed', completed)
+        self._set_attr('remaining', {size: self.fleet.get(size, 0) - counts.get(size, 0) for size in set(self.fleet) | set(counts)})
+        if min(self.remaining.values()) < 0:
+            self._set_attr('impossible', True)
+            return False
+
+        made_changes = False
+        for open_runs, add_water, full in ((open_rows, self._add_water, self.full_row), (open_cols, self._add_water_col, self.full_col)):
+            for i, run, size in open_runs:
+                biggest = max((s for s, n in self.remaining.items() if n > 0 and s >= size), default=0)
+                if biggest == 0:
+                    self._set_attr('impossible', True)
+                    return False
+                if biggest == size:
+                    made_changes |= add_water(i, ((run << 1) | (run >> 1)) & full & ~run)
+        return made_changes
+
+    def fill_board_water(self):
+        """Propaga as regras do jogo até não haver mais mudanças."""
+        made_changes = True
+        while made_changes and not self.impossible:
+            made_changes = False
+            # Água nas diagonais de todas as peças de barco
+            for row in range(self.rows):
+                ship = self.ship_r[row]
+                if ship:
+                    diagonals = ((ship << 1) | (ship >> 1)) & self.full_row
+                    if row > 0:
+                        made_changes |= self._add_water(row-1, diagonals)
+                    if row < self.rows-1:
+                        made_changes |= self._add_water(row+1, diagonals)
+            made_changes |= self._fill_middles()
+            if self.impossible:
+                return
+            made_changes |= self._fill_lines(self.ship_r, self.water_r, self.row_totals, self.full_row, self._add_ship, self._add_water)
+            if self.impossible:
+                return
+            made_changes |= self._fill_lines(self.ship_c, self.water_c, self.col_totals, self.full_col, self._add_ship_col, self._add_water_col)
+            if self.impossible:
+                return
+            made_changes |= self._count_ships()
+
+    def _can_place(self, ships: list, waters: list, hints: dict, cross_totals: list, cross_ships: list,
+                   line: int, start: int, size: int, length: int, remaining: int) -> bool:
+        """Verifica se um barco de tamanho size cabe na linha (ou coluna) line a partir de start.
+        ships/waters/hints são as máscaras na orientação do barco, cross_* na perpendicular."""
+        mask = ((1 << size) - 1) << start
+        ship = ships[line]
+        if waters[line] & mask:
+            return False
+        before, after = (1 << (start - 1)) if start > 0 else 0, (1 << (start + size)) if start + size < length else 0
+        if ship & (before | after):
+            return False
+        halo = (mask | (mask << 1) | (mask >> 1)) & ((1 << length) - 1)
+        if (line > 0 and ships[line-1] & halo) or (line < len(ships)-1 and ships[line+1] & halo):
+            return False
+        first, last = 1 << start, 1 << (start + size - 1)
+        if size == 1:
+            bad = hints['T'][line] | hints['B'][line] | hints['L'][line] | hints['R'][line] | hints['M'][line]
+        elif ships is self.ship_r:
+            bad = hints['T'][line] | hints['B'][line] | hints['C'][line] | hints['L'][line] & ~first \
+                | hints['R'][line] & ~last | hints['M'][line] & (first | last)
+        else:
+            bad = hints['L'][line] | hints['R'][line] | hints['C'][line] | hints['T'][line] & ~first \
+                | hints['B'][line] & ~last | hints['M'][line] & (first | last)
+        if bad & mask:
+            return False
+        new = mask & ~ship
+        if not new:
+            # Barco já completo e contado
+            waters_line = waters[line]
+            closed = (before == 0 or waters_line & before) and (after == 0 or waters_line & after)
+            if size == 1:
+                closed = closed and (line == 0 or waters[line-1] & mask) and (line == len(ships)-1 or waters[line+1] & mask)
+            if closed:
+                return False
+        if popcount(new) > remaining:
+            return False
+        while new:
+            low = new & -new
+            cross = low.bit_length() - 1
+            if cross_totals[cross] - popcount(cross_ships[cross]) < 1:
+                return False
+            new ^= low
+        return True
+
+    def remaining_fleet(self) -> dict:
+        """Devolve o número de barcos de cada tamanho que falta colocar."""
+        return dict(self.remaining)
+
+    def ships_left(self) -> int:
+        """Devolve o número total de barcos que falta colocar."""
+        return sum(self.remaining.values())
+
+    def unresolved(self) -> tuple or None:
+        """Devolve (células por preencher, peças de barco em falta somadas pelas linhas e colunas),
+        ou None se alguma linha ou coluna já não consegue atingir o seu total."""
+        unknown = deficit = 0
+        for ships, waters, totals, length in ((self.ship_r, self.water_r, self.row_totals, self.cols),
+                                              (self.ship_c, self.water_c, self.col_totals, self.rows)):
+            for ship, water, total in zip(ships, waters, totals):
+                placed, empty = popcount(ship), length - popcount(ship | water)
+                if placed > total or total - placed > empty:
+                    return None
+                if ships is self.ship_r:
+                    unknown += empty
+                deficit += total - placed
+        return unknown, deficit
+
+    def open_cells(self) -> list:
+        """Devolve as células de barco que ainda não pertencem a um barco completo."""
+        complete = [0] * self.rows
+        for row, run, _, closed in self._runs(self.ship_r, self.water_r, self.full_row):
+            if closed:
+                complete[row] |= run
+        for col, run, _, closed in self._runs(self.ship_c, self.water_c, self.full_col):
+            if closed:
+                while run:
+                    low = run & -run
+                    complete[low.bit_length() - 1] |= 1 << col
+                    run ^= low
+        cells = []
+        for row in range(self.rows):
+            open_ships = self.ship_r[row] & ~complete[row] & ~self._isolated(row)
+            while open_ships:
+                low = open_ships & -open_ships
+                cells.append((row, low.bit_length() - 1))
+                open_ships ^= low
+        return cells
+
+    def unknown_cells(self) -> list:
+        """Devolve as células por preencher."""
+        cells = []
+        for row in range(self.rows):
+            unknown = self.full_row & ~(self.ship_r[row] | self.water_r[row])
+            while unknown:
+                low = unknown & -unknown
+                cells.append((row, low.bit_length() - 1))
+                unknown ^= low
+        return cells
+
+    def possible_actions(self) -> list:
+        """Devolve a lista de ações possíveis para o maior barco que falta colocar,
+        pela mesma ordem canónica e no mesmo formato de Board.possible_actions."""
+        size = max((s for s, n in self.remaining.items() if n > 0), default=0)
+        if size == 0:
+            return []
+        return self.legal_placements(size, self.last_placement[size] + 1)
+
+    def legal_placements(self, size: int, start: int = 0) -> list:
+        """Devolve as ações legais para um barco de tamanho size, a partir da posição start
+        do índice de posições."""
+        row_left = [self.get_row_total(row) for row in range(self.rows)]
+        col_left = [self.get_col_total(col) for col in range(self.cols)]
+        actions = []
+        for placement in placement_index(self.rows, self.cols, size)[start:]:
+            row, col, _, orientation = placement.action
+            if orientation == 'v':
+                if self._can_place(self.ship_c, self.water_c, self.hints_c, self.row_totals, self.ship_r,
+                                   col, row, size, self.rows, col_left[col]):
+                    actions.append(placement.action)
+            elif self._can_place(self.ship_r, self.water_r, self.hints_r, self.col_totals, self.ship_c,
+                                 row, col, size, self.cols, row_left[row]):
+                actions.append(placement.action)
+        return actions
+
+    def place_ship(self, action: tuple):
+        """Aplica uma ação escolhida na procura, registando a sua posição para a ordem canónica."""
+        self._set_item(self.last_placement, len(action[2]), placement_position(self.rows, self.cols, action))
+        self.apply_action(action)
+
+    def apply_action(self, action: tuple):
+        """Aplica a ação ao tabuleiro: marca o barco, a água à sua volta e propaga."""
+        row, col, move, orientation = action
+        size = len(move)
+        if orientation == 'h' or size == 1:
+            ships, add_ship, add_water, line, start, length = self.ship_r, self._add_ship, self._add_water, row, col, self.cols
+        else:
+            ships, add_ship, add_water, line, start, length = self.ship_c, self._add_ship_col, self._add_water_col, col, row, self.rows
+        mask = ((1 << size) - 1) << start
+        halo = (mask | (mask << 1) | (mask >> 1)) & ((1 << length) - 1)
+        add_ship(line, mask)
+        add_water(line, halo & ~mask)
+        if line > 0:
+            add_water(line-1, halo)
+        if line < len(ships)-1:
+            add_water(line+1, halo)
+        self.fill_board_water()
+
+    @staticmethod
+    def parse_instance(from_input=sys.stdin) -> 'BitBoard':
+        """Lê uma instância no mesmo formato de Board.parse_instance."""
+        for board in BitBoard.parse_instances(from_input):
+            return board
+        raise ValueError("não há nenhuma instância para ler")
+
+    @staticmethod
+    def parse_instances(from_input=sys.stdin):
+        """Gera um tabuleiro por cada instância do ficheiro (ver read_instances)."""
+        for row_totals, col_totals, fleet, hints in read_instances(from_input):
+            yield BitBoard.from_instance(row_totals, col_totals, fleet, hints)
+
+    @staticmethod
+    def from_instance(row_totals: list, col_totals: list, fleet: dict, hints: list) -> 'BitBoard':
+        """Constrói o tabuleiro a partir dos campos de uma instância lida por parse_tokens."""
+        board = BitBoard(len(row_totals), len(col_totals), fleet)
+        board.row_totals = row_totals
+        board.col_totals = col_totals
+        for row, col, piece in hints:
+            board.hints_r[piece][row] |= 1 << col
+            board.hints_c[piece][col] |= 1 << row
+        board.apply_hints()
+        board.fill_board_water()
+        return board
+
+    def render_bytes(self) -> bytes:
+        """Devolve o texto que print_board() imprime, em bytes, como Board.render_bytes: as
+        linhas são escritas com os códigos de CODES, cada uma seguida do limite, e traduzidas com
+        OUTPUT_TABLE. A água sai diretamente das máscaras; só as células de barco passam por
+        get_value."""
+        width = self.cols + 1
+        out = bytearray((bytes(self.cols) + bytes([EDGE])) * self.rows)
+        water_hints = self.hints_r['W']
         for row in range(self.rows):
+            water, ships, start = self.water_r[row], self.ship_r[row], row * width
             for col in range(self.cols):
-                print(self.board[row][col], end='')
-            print()
+                bit = 1 << col
+                if water & bit:
+                    out[start + col] = CODES['W' if water_hints[row] & bit else '.']
+                elif ships & bit:
+                    out[start + col] = CODES[self.get_value(row, col)]
+        return bytes(out.translate(OUTPUT_TABLE))
+
+    def render(self) -> str:
+        """Devolve o texto que print_board() imprime."""
+        return self.render_bytes().decode('ascii')
+
+    def print_board(self, out=None):
+        """Imprime o tabuleiro no standard output (stdout), ou em out, com uma só escrita."""
+        write_output((self.render_bytes(),), out)
 
 ####################################################################################################
 
 class Bimaru(Problem):
-    def __init__(self, board: Board):
-        """O construtor especifica o estado inicial."""  
+    def __init__(self, board: Board, branching: str = 'ship', lookahead: bool = False):
+        """O construtor especifica o estado inicial, a forma de ramificar ('ship' coloca o
+        maior barco que falta; 'cell' escolhe a célula ou o tamanho de barco com menos opções)
+        e se cada tabuleiro gerado passa pelo teste de viabilidade feasible() (desligado por
+        omissão: nas instâncias do benchmark custa mais tempo do que os nós que poupa)."""  
         super().__init__(BimaruState(board))
+        self.branching = branching
+        self.lookahead = lookahead
 
     def actions(self, state: BimaruState) -> list:
         """Retorna uma lista de ações que podem ser executadas a
@@ -550,9 +1503,66 @@ class Bimaru(Problem):
         board: Board = state.get_board()
         if board.impossible:
             return []
+        if self.branching == 'cell':
+            return self.most_constrained_actions(board)
         actions = board.possible_actions()
         return actions
 
+    def most_constrained_actions(self, board: Board) -> list:
+        """Escolhe a célula de barco por completar ou o tamanho de barco com menos ações legais
+        (fail-first) e devolve só essas ações. Uma célula de barco tem de ser coberta por um dos
+        barcos que passam por ela; um tamanho de barco tem de ser colocado numa das suas posições
+        pela ordem canónica. As ações de uma célula levam-na como quinto elemento, para não
+        contarem para a ordem canónica."""
+        legal = {size: board.legal_placements(size)
+                 for size, count in sorted(board.remaining_fleet().items(), reverse=True) if count > 0}
+        if not legal:
+            return []
+        by_cell = {}
+        for size, actions in legal.items():
+            for action in actions:
+                row, col, _, orientation = action
+                for i in range(size):
+                    by_cell.setdefault((row + i, col) if orientation == 'v' else (row, col + i), []).append(action)
+        best, best_cell = None, None
+        for cell in board.open_cells():
+            options = by_cell.get(cell, [])
+            if best is None or len(options) < len(best):
+                best, best_cell = options, cell
+                if not best:
+                    return []
+        for size, actions in legal.items():
+            start = board.last_placement[size]
+            options = [action for action in actions if placement_position(board.rows, board.cols, action) > start]
+            if best is None or len(options) < len(best):
+                best, best_cell = options, None
+                if not best:
+                    return []
+        if best_cell is None:
+            return best
+        return [action + (best_cell,) for action in best]
+
+    def _place(self, board: Board, action: tuple):
+        """Coloca o barco da ação e propaga; as ações de uma célula não contam para a ordem
+        canónica. Com lookahead, marca o tabuleiro como impossível se não passar em feasible()."""
+        if len(action) > 4:
+            board.apply_action(action[:4])
+        else:
+            board.place_ship(action)
+        board.fill_board_water()
+        if self.lookahead and not board.impossible and not self.feasible(board):
+            board._set_attr('impossible', True)
+
+    def feasible(self, board: Board) -> bool:
+        """Condições necessárias para o tabuleiro ainda ter solução: cada tamanho de barco tem
+        pelo menos tantas posições legais disjuntas como barcos por colocar (ignorando a ordem
+        canónica), e as peças que faltam nas linhas e colunas cabem nas células por preencher."""
+        for size, count in board.remaining_fleet().items():
+            if count > 0 and max_disjoint_placements(board.legal_placements(size), size) < count:
+                return False
+        return totals_feasible([board.get_row_total(row) for row in range(board.rows)],
+                               [board.get_col_total(col) for col in range(board.cols)], board.unknown_cells())
+
 
     def result(self, state: BimaruState, action) -> BimaruState:
         """Retorna o estado resultante de executar a 'action' sobre
@@ -560,37 +1570,485 @@ class Bimaru(Problem):
         das presentes na lista obtida pela execução de
         self.actions(state)."""
         new_board: Board = state.get_board().copy()
-        new_board.apply_action(action)
-        new_board.fill_board_water()
+        self._place(new_board, action)
         child_state: BimaruState = BimaruState(new_board)
         return child_state
         
 
+    def apply(self, state: BimaruState, action) -> int:
+        """Executa a 'action' diretamente sobre o tabuleiro de 'state', sem o copiar.
+        Devolve a marca do trail que permite desfazer a ação com undo()."""
+        board: Board = state.get_board()
+        mark = board.mark()
+        self._place(board, action)
+        return mark
+
+    def undo(self, state: BimaruState, mark: int):
+        """Repõe o tabuleiro de 'state' como estava antes da ação que devolveu 'mark'."""
+        state.get_board().undo(mark)
+
     def goal_test(self, state: BimaruState) -> bool:
         """Retorna True se e só se o estado passado como argumento é
         um estado objetivo. Deve verificar se todas as posições do tabuleiro
         estão preenchidas de acordo com as regras do problema."""
         board: Board = state.get_board()
-        if board.impossible or board.num_submarines != 0 or board.num_destroyers != 0 or board.num_cruisers != 0 or board.num_battleships != 0:
+        if board.impossible or board.ships_left() != 0:
             return False
-        for row in range(board.rows):
-            if board.get_row_total(row) != 0:
-                return False
-            for col in range(board.cols):
-                if board.get_col_total(col) != 0 or board.get_value(row, col) is None:
-                    return False
-        return True
+        return board.is_full()
+
+    def path_cost(self, c, state1: BimaruState, action, state2: BimaruState):
+        """O custo de um passo é o número de barcos que ficaram completos com a ação, incluindo
+        os que a propagação completou. Todas as soluções têm assim o mesmo custo (a frota)."""
+        return c + state1.get_board().ships_left() - state2.get_board().ships_left()
 
     def h(self, node: Node):
-        """Função heuristica utilizada para a procura A*."""
-        # Não é usado
-        pass
+        """Função heuristica utilizada para a procura A*.
 
-if __name__ == "__main__":
-    board: Board = Board.parse_instance()
+        O custo que falta é exatamente o número de barcos por colocar; a este valor subtrai-se
+        uma fração no intervalo [0, 1] que cresce com as células já resolvidas e com as peças
+        de barco já colocadas nas linhas e colunas, para que os tabuleiros mais completos sejam
+        expandidos primeiro. Como nunca excede o custo real, a heurística é admissível. Os
+        tabuleiros que já não têm solução valem infinito."""
+        board: Board = node.state.get_board()
+        if board.impossible:
+            return float('inf')
+        counts = board.unresolved()
+        if counts is None:
+            return float('inf')
+        ships = board.ships_left()
+        if ships == 0:
+            return 0
+        unknown, deficit = counts
+        cells = board.rows * board.cols
+        return ships - 1 + (unknown + deficit) / (3 * cells)
+
+def backtracking_goals(problem: Bimaru, table: TranspositionTable = None, budget: SearchBudget = None):
+    """Percorre a árvore de procura em profundidade alterando o tabuleiro do estado inicial no
+    próprio sítio e desfazendo as alterações (através do trail) ao sair de cada ramo, em vez de
+    copiar o tabuleiro para cada filho. Visita os nós pela mesma ordem de depth_first_tree_search,
+    exceto que não volta a explorar tabuleiros já registados na tabela de transposição como sem
+    solução (por omissão é criada uma tabela nova).
+
+    Gera (estado, ações) em cada objetivo. O estado é o inicial, na configuração objetivo, e a
+    lista de ações é a da procura: ambos só são válidos até se pedir o objetivo seguinte.
+    Se o orçamento (budget) se esgotar, o tabuleiro volta ao estado inicial e a procura termina."""
+    if table is None:
+        table = TranspositionTable()
+    state = problem.initial
+    if budget is not None and not budget.charge():
+        return
+    if problem.goal_test(state):
+        yield state, []
+        return
+    stack = [iter(reversed(problem.actions(state)))]  # Ações por explorar em cada nível
+    marks, path = [], []
+    solved = []  # Se já houve um objetivo abaixo de cada ação aplicada
+    while stack:
+        action = next(stack[-1], None)
+        if action is None:
+            stack.pop()
+            if marks:
+                if not solved.pop():
+                    table.add(state.get_board())  # Todos os filhos falharam
+                problem.undo(state, marks.pop())
+                path.pop()
+            continue
+        marks.append(problem.apply(state, action))
+        path.append(action)
+        if state.get_board() in table:
+            problem.undo(state, marks.pop())
+            path.pop()
+            continue
+        if budget is not None and not budget.charge():
+            problem.undo(state, marks[0])
+            return
+        solved.append(False)
+        if problem.goal_test(state):
+            yield state, path
+            solved = [True] * len(solved)
+            stack.append(iter(()))  # Um objetivo é uma folha; o ramo é desfeito no próximo passo
+        else:
+            stack.append(iter(reversed(problem.actions(state))))
+
+
+def depth_first_backtracking_search(problem: Bimaru, table: TranspositionTable = None,
+                                    budget: SearchBudget = None) -> Node or None:
+    """Procura em profundidade com backtracking (ver backtracking_goals) que pára no primeiro objetivo.
+
+    Todos os nós do caminho devolvido partilham o mesmo estado, que fica na configuração
+    objetivo; os nós intermédios só servem para guardar as ações (node.solution())."""
+    for state, path in backtracking_goals(problem, table, budget):
+        node = Node(state)
+        for action in path:
+            node = Node(state, node, action, problem.path_cost(node.path_cost, state, action, state))
+        return node
+    return None
+
+
+def distinct_solutions(board: Board, engine: str = 'search', branching: str = 'ship', lookahead: bool = False,
+                       budget: SearchBudget = None):
+    """Gera as soluções distintas do tabuleiro, como o texto de print_board(), à medida que são
+    encontradas. Com o motor de procura os objetivos vêm de backtracking_goals, sem construir
+    nós, e os tabuleiros repetidos (possíveis com branching='cell') são descartados; com o motor
+    SAT cada modelo é bloqueado antes de procurar o seguinte. A enumeração pára quando o
+    orçamento (budget) se esgotar."""
+    if engine == 'sat':
+        yield from BimaruSAT(board).solutions(budget)
+        return
+    seen = set()
+    for state, _ in backtracking_goals(Bimaru(board, branching, lookahead), budget=budget):
+        text = state.get_board().render()
+        if text not in seen:
+            seen.add(text)
+            yield text
+
+
+def count_solutions(board: Board, limit: int = None, **options) -> int:
+    """Conta as soluções distintas do tabuleiro, parando quando chegar a limit (se dado).
+    As opções são as de distinct_solutions."""
+    count = 0
+    for _ in distinct_solutions(board, **options):
+        count += 1
+        if count == limit:
+            break
+    return count
+
+
+def _parallel_worker(tasks, results, cancel, search: str, branching: str, lookahead: bool,
+                     max_nodes: int, deadline: float):
+    """Processo de trabalho da procura paralela: resolve subproblemas da fila tasks até receber
+    None ou até cancel ser ativado, e responde com (ações desde a raiz ou None, motivo por que o
+    orçamento se esgotou ou None, erro ou None). Uma exceção na procura é enviada como erro, com
+    o traceback, e termina o processo. O prazo deadline é um instante de time.time(), ou None."""
+    while not cancel.is_set():
+        task = tasks.get()
+        if task is None:
+            break
+        board, path = task
+        try:
+            # O cancelamento é visto pela procura como um orçamento esgotado, que a faz parar logo
+            budget = SearchBudget(max_nodes, None if deadline is None else deadline - time.time(), cancel)
+            node = SEARCHES[search](Bimaru(board, branching, lookahead), budget=budget)
+        except Exception:
+            results.put((None, None, traceback.format_exc()))
+            break
+        results.put((path + node.solution() if node is not None else None, budget.exceeded, None))
+
+
+def parallel_depth_first_search(problem: Bimaru, workers: int = None, search: str = 'tree',
+                                max_split_depth: int = 3, budget: SearchBudget = None) -> Node or None:
+    """Procura em profundidade em vários processos. Expande a raiz, nível a nível e até
+    max_split_depth níveis, até haver pelo menos quatro subproblemas por processo; os
+    subproblemas vão para uma fila partilhada, pela ordem em que a procura sequencial os
+    visitaria, e cada processo resolve-os com a procura search. Quando um processo encontra
+    uma solução os restantes são cancelados. Se a procura falhar num processo, ou se todos os
+    processos terminarem (por exemplo, mortos por falta de memória) sem responder a todos os
+    subproblemas, os restantes são cancelados e é levantado RuntimeError.
+
+    O caminho devolvido é reconstruído no processo principal a partir das ações da solução.
+    Dentro de um processo sem filhos permitidos (por exemplo, no batch.py) a procura é sequencial.
+    O prazo e o cancelamento do orçamento (budget) valem para todos os processos; o limite de nós
+    conta os nós da divisão e, depois, os nós que sobram são o limite de cada processo."""
+    workers = workers or os.cpu_count()
+    if workers < 2 or multiprocessing.current_process().daemon:
+        return SEARCHES[search](problem, budget=budget)
+    root = Node(problem.initial)
+    if budget is not None and not budget.charge():
+        return None
+    if problem.goal_test(root.state):
+        return root
+    frontier = [root]
+    for _ in range(max_split_depth):
+        if len(frontier) >= 4 * workers:
+            break
+        children = []
+        for node in frontier:
+            for child in node.expand_lazily(problem, reverse=True):
+                if budget is not None and not budget.charge():
+                    return None
+                if problem.goal_test(child.state):
+                    return child
+                children.append(child)
+        frontier = children
+        if not frontier:
+            return None
 
-    problem: Bimaru = Bimaru(board)
+    max_nodes = deadline = None
+    if budget is not None:
+        if budget.max_nodes is not None:
+            max_nodes = budget.max_nodes - budget.nodes
+        if budget.deadline is not None:
+            deadline = time.time() + (budget.deadline - time.monotonic())
+    tasks, results, cancel = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Event()
+    for node in frontier:
+        tasks.put((node.state.get_board(), node.solution()))
+    for _ in range(workers):
+        tasks.put(None)
+    processes = [multiprocessing.Process(target=_parallel_worker,
+                                         args=(tasks, results, cancel, search, problem.branching, problem.lookahead,
+                                               max_nodes, deadline))
+                 for _ in range(min(workers, len(frontier)))]
+    for process in processes:
+        process.start()
+    solution, pending = None, len(frontier)
+    finished = False  # Se todos os processos já tinham terminado na última espera sem resposta
+    try:
+        while pending:
+            try:
+                solution, exceeded, error = results.get(timeout=0.1)
+            except queue.Empty:
+                if budget is not None and not budget.check():
+                    break
+                if all(process.exitcode is not None for process in processes):
+                    if finished:
+                        raise RuntimeError("os processos de trabalho terminaram sem resolver {} subproblemas".format(pending))
+                    finished = True  # Esperar mais uma vez pelas respostas ainda a caminho
+                continue
+            if error is not None:
+                raise RuntimeError("a procura falhou num processo de trabalho:\n" + error)
+            pending -= 1
+            if solution is not None:
+                break
+            if exceeded is not None:
+                budget.exceeded = exceeded  # Um processo esgotou o seu limite de nós ou o prazo
+                break
+    finally:
+        cancel.set()
+        tasks.cancel_join_thread()
+        for process in processes:
+            process.join()
+    if solution is None:
+        return None
+    node = root
+    for action in solution:
+        node = node.child_node(problem, action)
+    return node
+
+
+class BimaruSAT:
+    """Motor alternativo à procura: codifica um tabuleiro lido por parse_instance em CNF e
+    resolve-o com o resolvedor CDCL de sat.py.
+
+    Cada célula tem uma variável, verdadeira se a célula tiver uma peça de barco. As cláusulas
+    fixam as células já conhecidas e a forma das pistas, põem água nas diagonais das peças de
+    barco, obrigam cada linha e coluna a ter exatamente o seu total de peças e, para cada tamanho,
+    definem uma variável por segmento possível (peças seguidas com água ou o limite nas pontas),
+    das quais exatamente tantas como os barcos desse tamanho na frota são verdadeiras."""
+
+    def __init__(self, board: Board, fleet: dict = None):
+        self.rows, self.cols = board.rows, board.cols
+        self.fleet = dict(fleet or board.fleet)
+        self.solver = Solver()
+        # As decisões começam pelas células e não pelas variáveis auxiliares das restrições
+        self.cells = [[self.solver.new_var(priority=1.0) for _ in range(self.cols)] for _ in range(self.rows)]
+        self.hints = {}  # Células com pista, que são impressas em maiúsculas
+        self._encode(board)
+
+    def ship(self, row: int, col: int):
+        """Devolve o literal 'a célula tem uma peça de barco' (False fora do tabuleiro)."""
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return self.cells[row][col]
+        return False
+
+    def water(self, row: int, col: int):
+        """Devolve o literal 'a célula é água' (True fora do tabuleiro)."""
+        return negate(self.ship(row, col))
+
+    def _encode(self, board: Board):
+        solver = self.solver
+        row_totals = [board.get_row_total(row) for row in range(self.rows)]
+        col_totals = [board.get_col_total(col) for col in range(self.cols)]
+        for row in range(self.rows):
+            for col in range(self.cols):
+                value = board.get_value(row, col)
+                if value is None:
+                    continue
+                if value in EMPTY_SPACE:
+                    solver.add_clause([-self.cells[row][col]])
+                else:
+                    solver.add_clause([self.cells[row][col]])
+                    row_totals[row] += 1
+                    col_totals[col] += 1
+                if value.isupper():
+                    self.hints[(row, col)] = value
+                    self._encode_hint(row, col, value)
+        for row in range(self.rows - 1):
+            for col in range(self.cols):
+                # Uma peça de barco tem água nas diagonais (basta olhar para a linha de baixo)
+                for d_col in (-1, 1):
+                    add_clause(solver, [-self.cells[row][col], self.water(row + 1, col + d_col)])
+        for row in range(self.rows):
+            add_exactly(solver, self.cells[row], row_totals[row])
+        for col in range(self.cols):
+            add_exactly(solver, [self.cells[row][col] for row in range(self.rows)], col_totals[col])
+        self._encode_fleet()
+
+    def _encode_hint(self, row: int, col: int, piece: str):
+        """Acrescenta as cláusulas da forma da pista (a própria célula já está fixada)."""
+        solver = self.solver
+        up, down = (row - 1, col), (row + 1, col)
+        left, right = (row, col - 1), (row, col + 1)
+        ships, waters = {
+            'C': ((), (up, down, left, right)),
+            'T': ((down,), (up, left, right)),
+            'B': ((up,), (down, left, right)),
+            'L': ((right,), (left, up, down)),
+            'R': ((left,), (right, up, down)),
+            'M': ((), ()),
+            'W': ((), ()),
+        }[piece]
+        for cell in ships:
+            add_clause(solver, [self.ship(*cell)])
+        for cell in waters:
+            add_clause(solver, [self.water(*cell)])
+        if piece == 'M':
+            # Peça do meio: horizontal (vizinhos à esquerda e à direita) ou vertical (em cima e em baixo)
+            horizontal = solver.new_var()
+            add_clause(solver, [-horizontal, self.ship(*left)])
+            add_clause(solver, [-horizontal, self.ship(*right)])
+            add_clause(solver, [horizontal, self.ship(*up)])
+            add_clause(solver, [horizontal, self.ship(*down)])
+
+    def _encode_fleet(self):
+        """Conta os barcos de cada tamanho através dos segmentos que os podem conter e proíbe
+        sequências de peças maiores do que o maior barco da frota."""
+        solver = self.solver
+        max_size = max(self.fleet)
+        covering = {(row, col): [] for row in range(self.rows) for col in range(self.cols)}
+        for size in range(1, max_size + 1):
+            segments = []
+            for row in range(self.rows):
+                for col in range(self.cols):
+                    for d_row, d_col in ((0, 1), (1, 0)) if size > 1 else ((0, 1),):
+                        if row + d_row * (size - 1) >= self.rows or col + d_col * (size - 1) >= self.cols:
+                            continue
+                        cells = [(row + d_row * i, col + d_col * i) for i in range(size)]
+                        lits = [self.ship(*cell) for cell in cells]
+                        lits.append(self.water(row - d_row, col - d_col))
+                        lits.append(self.water(row + d_row * size, col + d_col * size))
+                        if size == 1:
+                            lits += [self.water(row - 1, col), self.water(row + 1, col)]
+                        segment = define_and(solver, lits)
+                        if segment is False:
+                            continue
+                        segments.append(segment)
+                        for cell in cells:
+                            covering[cell].append(segment)
+            add_exactly(solver, segments, self.fleet.get(size, 0))
+        # Redundante, mas ajuda a propagação: cada peça de barco pertence a um dos segmentos
+        for (row, col), segments in covering.items():
+            add_clause(solver, [-self.cells[row][col]] + segments)
+        for row in range(self.rows):
+            for col in range(self.cols):
+                for d_row, d_col in ((0, 1), (1, 0)):
+                    if row + d_row * max_size < self.rows and col + d_col * max_size < self.cols:
+                        solver.add_clause([-self.ship(row + d_row * i, col + d_col * i) for i in range(max_size + 1)])
+
+    def solve(self, budget: SearchBudget = None) -> Board or None:
+        """Resolve a codificação e devolve o tabuleiro da solução, pronto para print_board(),
+        ou None se a instância não tiver solução ou o orçamento se esgotar (cada conflito conta
+        como um nó)."""
+        if not self.solver.solve(budget):
+            return None
+        return self._decode(self.solver.model)
+
+    def solutions(self, budget: SearchBudget = None):
+        """Gera o texto de print_board() de cada solução, acrescentando depois de cada modelo
+        uma cláusula que o exclui (só as variáveis das células contam)."""
+        while self.solver.solve(budget):
+            model = self.solver.model
+            yield self._decode(model).render()
+            self.solver.add_clause([-v if model[v] > 0 else v for line in self.cells for v in line])
+
+    def _decode(self, model: list) -> Board:
+        """Converte um modelo num tabuleiro com as formas das peças."""
+        is_ship = lambda row, col: 0 <= row < self.rows and 0 <= col < self.cols and model[self.cells[row][col]] > 0
+        board = Board(self.rows, self.cols)
+        for row in range(self.rows):
+            for col in range(self.cols):
+                if (row, col) in self.hints:
+                    value = self.hints[(row, col)]
+                elif not is_ship(row, col):
+                    value = '.'
+                elif is_ship(row - 1, col) or is_ship(row + 1, col):
+                    value = 'm' if is_ship(row - 1, col) and is_ship(row + 1, col) else 'b' if is_ship(row - 1, col) else 't'
+                elif is_ship(row, col - 1) or is_ship(row, col + 1):
+                    value = 'm' if is_ship(row, col - 1) and is_ship(row, col + 1) else 'r' if is_ship(row, col - 1) else 'l'
+                else:
+                    value = 'c'
+                board.set_value(row, col, value)
+        return board
+
+
+BOARDS = {'list': Board, 'bits': BitBoard}
+SEARCHES = {'tree': depth_first_tree_search, 'graph': depth_first_graph_search,
+            'backtracking': depth_first_backtracking_search, 'astar': astar_search, 'greedy': greedy_search,
+            'parallel': parallel_depth_first_search}
+
+
+
+def add_solver_arguments(parser):
+    """Acrescenta ao parser (argparse) as opções que escolhem o motor, a procura e o tabuleiro."""
+    parser.add_argument('--board', choices=BOARDS, default='list',
+                        help="representação do tabuleiro: listas de caracteres ou máscaras de bits")
+    parser.add_argument('--search', choices=SEARCHES, default='tree',
+                        help="procura em profundidade com uma cópia do tabuleiro por filho, sem repetir estados ou com backtracking, "
+                             "ou procura A*/gananciosa com a heurística Bimaru.h, ou em profundidade em paralelo, um processo por CPU")
+    parser.add_argument('--engine', choices=('search', 'sat'), default='search',
+                        help="resolver com a procura escolhida em --search ou com a codificação SAT")
+    parser.add_argument('--branching', choices=('ship', 'cell'), default='ship',
+                        help="ramificar no maior barco que falta ou na célula/tamanho de barco com menos opções")
+    parser.add_argument('--lookahead', action='store_true',
+                        help="testar a viabilidade de cada tabuleiro gerado (Bimaru.feasible); "
+                             "poupa alguns nós, mas em geral custa mais tempo do que poupa")
+    parser.add_argument('--max-nodes', type=int,
+                        help="desistir depois de visitar este número de nós (de conflitos, com --engine sat)")
+    parser.add_argument('--timeout', type=float,
+                        help="desistir ao fim deste número de segundos")
+
+
+def solve(board: Board, engine: str = 'search', search: str = 'tree', branching: str = 'ship',
+          lookahead: bool = False, budget: SearchBudget = None) -> Board or None:
+    """Resolve o tabuleiro com as opções de add_solver_arguments() e devolve o tabuleiro da
+    solução, pronto para print_board(), ou None se não houver solução ou o orçamento se esgotar
+    (budget.exceeded distingue os dois casos)."""
+    if engine == 'sat':
+        return BimaruSAT(board).solve(budget)
+    problem: Bimaru = Bimaru(board, branching, lookahead)
+    goal_node: Node = SEARCHES[search](problem, budget=budget)
+    return goal_node.state.get_board() if goal_node is not None else None
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Resolve uma instância de Bimaru lida do standard input.")
+    add_solver_arguments(parser)
+    parser.add_argument('--mode', choices=('solve', 'all', 'count', 'unique'), default='solve',
+                        help="imprimir uma solução, todas as soluções (separadas por uma linha vazia), "
+                             "o número de soluções, ou UNIQUE/MULTIPLE/NONE conforme a instância tem uma, "
+                             "mais do que uma ou nenhuma solução")
+    args = parser.parse_args()
 
-    goal_node: Node = depth_first_tree_search(problem)
+    board = BOARDS[args.board].parse_instance()
 
-    goal_node.state.get_board().print_board()
+    budget = SearchBudget(args.max_nodes, args.timeout)
+    options = {'engine': args.engine, 'branching': args.branching, 'lookahead': args.lookahead, 'budget': budget}
+    if args.mode == 'all':
+        write_output(text.encode('ascii') + b'\n' for text in distinct_solutions(board, **options))
+    elif args.mode == 'count':
+        print(count_solutions(board, **options))
+    elif args.mode == 'unique':
+        print(['NONE', 'UNIQUE', 'MULTIPLE'][count_solutions(board, limit=2, **options)])
+    else:
+        result = run_search(solve, board, budget, engine=args.engine, search=args.search,
+                            branching=args.branching, lookahead=args.lookahead)
+        if result.status == 'solved':
+            result.node.print_board()
+        elif result.status == 'exhausted':
+            print("Sem solução ({} nós)".format(result.stats['nodes']), file=sys.stderr)
+            sys.exit(1)
+    if budget.exceeded:
+        # Em count/unique/all o que foi impresso é só o que se encontrou até aqui
+        stats = budget.stats()
+        print("Orçamento esgotado ({exceeded}): {nodes} nós em {elapsed:.2f} s".format(**stats), file=sys.stderr)
+        sys.exit(2)
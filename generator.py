@@ -0,0 +1,163 @@
+# generator.py: Gera instâncias aleatórias de Bimaru no formato lido por Board.parse_instance.
+# Coloca a frota ao acaso num tabuleiro do tamanho pedido, calcula os totais das linhas e colunas
+# a partir dela e revela como pistas uma fração (densidade) das células, escolhidas ao acaso.
+# Com --unique acrescenta depois pistas até o próprio resolvedor confirmar que a solução é única.
+#
+# Utilização:
+#   python3 generator.py 20 --count 5 --density 0.05 --seed 1 > varias.txt   # fluxo para o batch.py
+#   python3 generator.py 15 12 --count 3 --out-dir gerados/                    # gerados/15x12-0.txt, ...
+#   python3 generator.py 12 --count 1000 --unique --workers 4 > unicas.txt
+#   python3 generator.py 20 --fleet 6:1 5:2 4:3 3:4 2:5 1:6 > porta-avioes.txt
+#
+# Com --seed a instância i depende só da semente e de i, e não do número de processos.
+
+import argparse
+import io
+import os
+import random
+import sys
+from multiprocessing import Pool
+
+from bimaru import FLEET, Board, distinct_solutions, parse_fleet
+
+
+def place_fleet(rows: int, cols: int, fleet: dict, rng: random.Random, attempts: int = 100) -> list:
+    """Coloca os barcos da frota, do maior para o menor, cada um numa posição escolhida ao acaso
+    entre as que não tocam (nem na diagonal) os barcos já colocados. Devolve a grelha, uma lista
+    de linhas com True nas células de barco; recomeça se um barco deixar de caber e desiste com
+    ValueError ao fim de attempts tentativas."""
+    sizes = [size for size in sorted(fleet, reverse=True) for _ in range(fleet[size])]
+    for _ in range(attempts):
+        grid = [[False] * cols for _ in range(rows)]
+        blocked = [[False] * cols for _ in range(rows)]  # Barcos e as células à sua volta
+        for size in sizes:
+            options = [(row, col, d_row, d_col)
+                       for d_row, d_col in (((0, 1), (1, 0)) if size > 1 else ((0, 1),))
+                       for row in range(rows - d_row * (size - 1))
+                       for col in range(cols - d_col * (size - 1))
+                       if not any(blocked[row + d_row * i][col + d_col * i] for i in range(size))]
+            if not options:
+                break
+            row, col, d_row, d_col = rng.choice(options)
+            for i in range(size):
+                r, c = row + d_row * i, col + d_col * i
+                grid[r][c] = True
+                for y in range(max(0, r - 1), min(rows, r + 2)):
+                    for x in range(max(0, c - 1), min(cols, c + 2)):
+                        blocked[y][x] = True
+        else:
+            return grid
+    raise ValueError("a frota não cabe num tabuleiro {}x{}".format(rows, cols))
+
+
+def piece(grid: list, row: int, col: int) -> str:
+    """Devolve a pista da célula (row, col) da grelha: 'W' para água ou a forma da peça."""
+    if not grid[row][col]:
+        return 'W'
+    ship = lambda r, c: 0 <= r < len(grid) and 0 <= c < len(grid[0]) and grid[r][c]
+    up, down, left, right = ship(row - 1, col), ship(row + 1, col), ship(row, col - 1), ship(row, col + 1)
+    if (up and down) or (left and right):
+        return 'M'
+    if up or down:
+        return 'B' if up else 'T'
+    if left or right:
+        return 'R' if left else 'L'
+    return 'C'
+
+
+def format_instance(grid: list, hints: list, fleet: dict = None) -> str:
+    """Escreve a instância: os totais das linhas e colunas da grelha, a linha FLEET se a frota
+    não for a normal, e as pistas (row, col)."""
+    rows = [sum(line) for line in grid]
+    cols = [sum(column) for column in zip(*grid)]
+    lines = ['ROW\t' + '\t'.join(map(str, rows)), 'COLUMN\t' + '\t'.join(map(str, cols))]
+    if fleet and fleet != FLEET:
+        lines.append('FLEET\t' + '\t'.join('{}:{}'.format(size, fleet[size]) for size in sorted(fleet, reverse=True)))
+    lines.append(str(len(hints)))
+    lines += ['HINT\t{}\t{}\t{}'.format(row, col, piece(grid, row, col)) for row, col in hints]
+    return '\n'.join(lines) + '\n'
+
+
+def random_instance(rows: int, cols: int, density: float = 0.05, fleet: dict = None,
+                    rng: random.Random = random) -> str:
+    """Gera uma instância com a frota dada (por omissão, a normal) e round(density * células)
+    pistas em células distintas escolhidas ao acaso, de barco ou de água."""
+    grid = place_fleet(rows, cols, fleet or FLEET, rng)
+    cells = [(row, col) for row in range(rows) for col in range(cols)]
+    hints = sorted(rng.sample(cells, round(density * len(cells))))
+    return format_instance(grid, hints, fleet)
+
+
+def unique_instance(rows: int, cols: int, density: float = 0.0, fleet: dict = None,
+                    rng: random.Random = random, engine: str = 'search') -> str:
+    """Gera uma instância com uma só solução. Começa como random_instance e, enquanto o
+    resolvedor (com o motor engine) encontrar uma solução diferente da frota escondida, revela
+    como pista uma das células em que essa solução difere, escolhida ao acaso; cada pista
+    elimina pelo menos a solução encontrada, e a instância fica pronta quando só resta a frota."""
+    grid = place_fleet(rows, cols, fleet or FLEET, rng)
+    cells = [(row, col) for row in range(rows) for col in range(cols)]
+    hints = set(rng.sample(cells, round(density * len(cells))))
+    while True:
+        text = format_instance(grid, sorted(hints), fleet)
+        board = Board.parse_instance(io.StringIO(text))
+        for solution in distinct_solutions(board, engine):
+            lines = solution.splitlines()
+            wrong = [(row, col) for row, col in cells if (lines[row][col] not in '.W') != grid[row][col]]
+            if wrong:
+                hints.add(rng.choice(wrong))
+                break
+        else:
+            return text
+
+
+def generate(job: tuple) -> str:
+    """Gera uma instância num processo de trabalho. Recebe (rows, cols, densidade, frota, única,
+    motor, semente, índice); sem semente usa um gerador com estado aleatório."""
+    rows, cols, density, fleet, unique, engine, seed, index = job
+    rng = random.Random('{}-{}'.format(seed, index) if seed is not None else None)
+    if unique:
+        return unique_instance(rows, cols, density, fleet, rng, engine)
+    return random_instance(rows, cols, density, fleet, rng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera instâncias aleatórias de Bimaru.")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('cols', type=int, nargs='?', help="por omissão, igual a rows")
+    parser.add_argument('--count', type=int, default=1, help="número de instâncias")
+    parser.add_argument('--density', type=float, default=0.05, help="fração das células dadas como pistas")
+    parser.add_argument('--seed', type=int, help="semente do gerador (para repetir as instâncias)")
+    parser.add_argument('--fleet', nargs='+', metavar='TAMANHO:NÚMERO',
+                        help="frota a colocar (por omissão a normal, 4:1 3:2 2:3 1:4)")
+    parser.add_argument('--unique', action='store_true',
+                        help="acrescentar pistas até a instância ter uma só solução")
+    parser.add_argument('--engine', choices=('search', 'sat'), default='search',
+                        help="motor usado para verificar a unicidade")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="número de processos de trabalho")
+    parser.add_argument('--out-dir', help="escrever <rows>x<cols>-<i>.txt neste diretório em vez do standard output")
+    args = parser.parse_args()
+    cols = args.cols or args.rows
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    fleet = parse_fleet(args.fleet) if args.fleet else None
+    jobs = [(args.rows, cols, args.density, fleet, args.unique, args.engine, args.seed, i) for i in range(args.count)]
+    if args.workers > 1:
+        pool = Pool(args.workers)
+        texts = pool.imap(generate, jobs, chunksize=max(1, args.count // (4 * args.workers)))
+    else:
+        pool, texts = None, map(generate, jobs)
+    for i, text in enumerate(texts):
+        if args.out_dir:
+            with open(os.path.join(args.out_dir, '{}x{}-{}.txt'.format(args.rows, cols, i)), 'w') as f:
+                f.write(text)
+        else:
+            sys.stdout.write(text)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# profiler.py: Mede onde se gasta o tempo ao resolver instâncias de Bimaru.
+# Para cada fase (leitura, propagação, geração de ações, cópias, testes de objetivo, ...) regista
+# o número de chamadas e o tempo total e máximo por chamada, e guarda os histogramas do fator de
+# ramificação e da profundidade dos nós expandidos. O relatório é escrito em JSON.
+#
+# Utilização: python3 profiler.py [opções do bimaru.py] [--out relatorio.json] [instâncias...]
+#
+# Os métodos só são substituídos por versões cronometradas dentro de um bloco "with Profiler()";
+# fora dele o código corre sem qualquer custo adicional.
+
+import argparse
+import functools
+import glob
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+
+from search import SearchBudget
+from utils import print_table
+from bimaru import BOARDS, Bimaru, BimaruSAT, Board, BitBoard, add_solver_arguments, solve
+
+# Métodos cronometrados em cada classe (os que a classe não define são ignorados)
+PHASES = {
+    Board: ['parse_instance', 'remove_complete_hints', 'fill_board_water', 'complete_unknown',
+            'possible_actions', 'legal_placements', 'copy', 'is_full'],
+    BitBoard: ['parse_instance', 'apply_hints', 'fill_board_water', 'possible_actions', 'legal_placements',
+               'copy', 'is_full'],
+    Bimaru: ['actions', 'result', 'apply', 'undo', 'goal_test', 'feasible', 'h'],
+    BimaruSAT: ['_encode', 'solve'],
+}
+
+
+class Profiler:
+    """Instrumentação ativada num bloco with: substitui os métodos de PHASES por versões que
+    acumulam [chamadas, tempo total, tempo máximo] e, através de Bimaru.actions, regista o
+    fator de ramificação e a profundidade de cada nó expandido. Os tempos de uma fase incluem
+    os das fases que ela chama (por exemplo, fill_board_water inclui complete_unknown).
+
+    A profundidade de cada estado é seguida pelo seu id: result() dá ao filho a profundidade do
+    pai mais um, e apply()/undo() alteram a do próprio estado (procura com backtracking). Só o
+    processo atual é medido: os processos da procura paralela não entram no relatório."""
+
+    def __init__(self, phases: dict = PHASES):
+        self.phases = phases
+        self.timers = {}
+        self.branching = Counter()
+        self.depth = Counter()
+        self._depths = {}
+        self._originals = []
+
+    def __enter__(self):
+        for cls, names in self.phases.items():
+            for name in names:
+                if name in cls.__dict__:
+                    self._install(cls, name)
+        return self
+
+    def __exit__(self, *exc):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals.clear()
+        return False
+
+    def _install(self, cls, name: str):
+        original = cls.__dict__[name]
+        function = original.__func__ if isinstance(original, staticmethod) else original
+        wrapper = self._timed('{}.{}'.format(cls.__name__, name), function)
+        if cls is Bimaru and name in ('actions', 'result', 'apply', 'undo'):
+            wrapper = getattr(self, '_track_' + name)(wrapper)
+        self._originals.append((cls, name, original))
+        setattr(cls, name, staticmethod(wrapper) if isinstance(original, staticmethod) else wrapper)
+
+    def _timed(self, name: str, function):
+        timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+        clock = time.perf_counter
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                timer[0] += 1
+                timer[1] += elapsed
+                if elapsed > timer[2]:
+                    timer[2] = elapsed
+        return wrapper
+
+    def _track_actions(self, actions):
+        def wrapper(problem, state):
+            result = actions(problem, state)
+            self.branching[len(result)] += 1
+            self.depth[self._depths.get(state.id, 0)] += 1
+            return result
+        return wrapper
+
+    def _track_result(self, result):
+        def wrapper(problem, state, action):
+            child = result(problem, state, action)
+            self._depths[child.id] = self._depths.get(state.id, 0) + 1
+            return child
+        return wrapper
+
+    def _track_apply(self, apply):
+        def wrapper(problem, state, action):
+            mark = apply(problem, state, action)
+            self._depths[state.id] = self._depths.get(state.id, 0) + 1
+            return mark
+        return wrapper
+
+    def _track_undo(self, undo):
+        def wrapper(problem, state, mark):
+            undo(problem, state, mark)
+            self._depths[state.id] = self._depths.get(state.id, 0) - 1
+        return wrapper
+
+    def report(self) -> dict:
+        """Devolve o relatório como um dicionário pronto para json.dump: o tempo de cada fase
+        chamada pelo menos uma vez, em segundos e microssegundos por chamada, e os histogramas
+        (número de nós expandidos por fator de ramificação e por profundidade)."""
+        phases = {name: {'calls': calls, 'total_s': total, 'mean_us': total / calls * 1e6, 'max_us': longest * 1e6}
+                  for name, (calls, total, longest) in self.timers.items() if calls}
+        return {'phases': phases,
+                'expanded': sum(self.branching.values()),
+                'branching': {str(k): self.branching[k] for k in sorted(self.branching)},
+                'depth': {str(k): self.depth[k] for k in sorted(self.depth)}}
+
+
+def profile_instance(path: str, options: dict) -> dict:
+    """Lê e resolve uma instância dentro de um Profiler e devolve o relatório, com o tempo
+    total e o estado final (resolvida, sem solução ou limite excedido)."""
+    budget = SearchBudget(options['max_nodes'], options['timeout'])
+    with Profiler() as profiler:
+        start = time.perf_counter()
+        with open(path) as f:
+            board = BOARDS[options['board']].parse_instance(f)
+        solution = solve(board, options['engine'], options['search'], options['branching'], options['lookahead'], budget)
+        elapsed = time.perf_counter() - start
+    report = profiler.report()
+    report['elapsed_s'] = elapsed
+    report['status'] = 'solved' if solution is not None else budget.exceeded or 'exhausted'
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo de cada fase da resolução de instâncias de Bimaru.")
+    parser.add_argument('instances', nargs='*', default=sorted(glob.glob('tests/instance*.txt')),
+                        help="ficheiros de instâncias (por omissão tests/instance*.txt)")
+    parser.add_argument('--out', help="ficheiro para o relatório JSON (por omissão, o standard output)")
+    add_solver_arguments(parser)
+    args = parser.parse_args()
+    options = {name: getattr(args, name) for name in ('board', 'engine', 'search', 'branching', 'lookahead',
+                                                      'max_nodes', 'timeout')}
+
+    reports = {path: profile_instance(path, options) for path in args.instances}
+    totals = {}
+    for report in reports.values():
+        for name, phase in report['phases'].items():
+            total = totals.setdefault(name, [0, 0.0])
+            total[0] += phase['calls']
+            total[1] += phase['total_s']
+    elapsed = sum(report['elapsed_s'] for report in reports.values())
+
+    text = json.dumps({'options': options, 'instances': reports}, indent=2) + '\n'
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    table = [[name, calls, '{:.1f}'.format(total * 1000), '{:.1f}'.format(total / elapsed * 100) if elapsed else '']
+             for name, (calls, total) in sorted(totals.items(), key=lambda item: -item[1][1])]
+    table.append(['total ({} instâncias)'.format(len(reports)), '', '{:.1f}'.format(elapsed * 1000), '100.0'])
+    with redirect_stdout(sys.stderr):
+        print_table(table, ['fase', 'chamadas', 'ms', '%'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+# sat.py: Resolvedor SAT CDCL em Python puro, usado pelo motor SAT do Bimaru.
+#
+# Implementa os componentes habituais de um resolvedor CDCL: propagação unitária com dois literais
+# vigiados por cláusula, aprendizagem de cláusulas pelo primeiro ponto de implicação único (1UIP)
+# com minimização local, escolha de variáveis por atividade (VSIDS), guarda de fase, reinícios
+# segundo a sequência de Luby e limpeza periódica das cláusulas aprendidas pior classificadas (LBD).
+#
+# Os literais são inteiros diferentes de zero no estilo DIMACS: v é a variável v verdadeira e -v a
+# variável v falsa.
+
+import heapq
+
+VAR_DECAY = 0.95
+RESTART_BASE = 100
+LEARNT_START = 2000
+LEARNT_GROWTH = 1.1
+
+
+def luby(i: int) -> int:
+    """Devolve o i-ésimo termo (a contar de 0) da sequência de Luby: 1 1 2 1 1 2 4 1 1 2 ..."""
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 1 << seq
+
+
+class Solver:
+    """Resolvedor SAT CDCL incremental: podem acrescentar-se variáveis e cláusulas entre
+    chamadas a solve(), por exemplo para bloquear um modelo já encontrado."""
+
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []        # Cláusulas com dois ou mais literais; os dois primeiros são os vigiados
+        self.learnt = []         # Índices das cláusulas aprendidas (None depois de apagadas)
+        self.lbd = {}            # Índice de cláusula aprendida -> número de níveis distintos (LBD)
+        self.watches = {}        # Literal -> índices das cláusulas que o vigiam
+        self.value = [0]         # Por variável: 1 (verdadeira), -1 (falsa) ou 0 (por atribuir)
+        self.level = [0]
+        self.reason = [None]
+        self.activity = [0.0]
+        self.phase = [-1]        # Último valor de cada variável, usado na próxima decisão
+        self.seen = [False]
+        self.heap = []           # Pares (-atividade, variável), com entradas desatualizadas ignoradas
+        self.trail = []
+        self.trail_lim = []      # Posição no trail onde começa cada nível de decisão
+        self.qhead = 0
+        self.var_inc = 1.0
+        self.max_learnt = LEARNT_START
+        self.ok = True
+        self.model = None
+        self.conflicts = self.decisions = self.propagations = 0
+
+    def new_var(self, priority: float = 0.0) -> int:
+        """Cria uma variável nova e devolve-a. A prioridade é a atividade inicial: as variáveis
+        com prioridade maior são escolhidas primeiro nas decisões até haver conflitos."""
+        self.num_vars += 1
+        v = self.num_vars
+        self.watches[v] = []
+        self.watches[-v] = []
+        self.value.append(0)
+        self.level.append(0)
+        self.reason.append(None)
+        self.activity.append(priority)
+        self.phase.append(-1)
+        self.seen.append(False)
+        heapq.heappush(self.heap, (-priority, v))
+        return v
+
+    def add_clause(self, lits) -> bool:
+        """Acrescenta uma cláusula. Devolve False se o problema passou a ser impossível."""
+        if not self.ok:
+            return False
+        self._cancel(0)
+        clause = []
+        for lit in set(lits):
+            if -lit in clause or self._lit_value(lit) == 1:
+                return True  # Tautologia ou já satisfeita
+            if self._lit_value(lit) == 0:
+                clause.append(lit)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self._assign(clause[0], None)
+            self.ok = self._propagate() is None
+        else:
+            self.watches[clause[0]].append(len(self.clauses))
+            self.watches[clause[1]].append(len(self.clauses))
+            self.clauses.append(clause)
+        return self.ok
+
+    def solve(self, budget=None) -> bool or None:
+        """Procura uma atribuição que satisfaça todas as cláusulas. Se existir, fica em
+        self.model (1 ou -1 por variável) e devolve True; caso contrário devolve False.
+        Com um orçamento (search.SearchBudget) cada conflito conta como um nó, e a procura
+        devolve None se o orçamento se esgotar."""
+        self.model = None
+        if not self.ok:
+            return False
+        self._cancel(0)
+        if self._propagate() is not None:
+            self.ok = False
+            return False
+        restarts = 0
+        while True:
+            status = self._search(RESTART_BASE * luby(restarts), budget)
+            if status is not None:
+                return status if status != 'budget' else None
+            restarts += 1
+            self._cancel(0)
+
+    def _lit_value(self, lit: int) -> int:
+        return self.value[lit] if lit > 0 else -self.value[-lit]
+
+    def _assign(self, lit: int, reason):
+        v = abs(lit)
+        self.value[v] = 1 if lit > 0 else -1
+        self.level[v] = len(self.trail_lim)
+        self.reason[v] = reason
+        self.trail.append(lit)
+
+    def _cancel(self, level: int):
+        """Desfaz as atribuições dos níveis de decisão acima de level."""
+        if len(self.trail_lim) <= level:
+            return
+        start = self.trail_lim[level]
+        value, phase, reason, activity, heap = self.value, self.phase, self.reason, self.activity, self.heap
+        for lit in self.trail[start:]:
+            v = abs(lit)
+            phase[v] = value[v]
+            value[v] = 0
+            reason[v] = None
+            heapq.heappush(heap, (-activity[v], v))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def _propagate(self):
+        """Propagação unitária com literais vigiados. Devolve o índice de uma cláusula em
+        conflito, ou None."""
+        value, clauses, watches, trail = self.value, self.clauses, self.watches, self.trail
+        while self.qhead < len(trail):
+            false_lit = -trail[self.qhead]
+            self.qhead += 1
+            self.propagations += 1
+            ws = watches[false_lit]
+            kept = []
+            for i, ci in enumerate(ws):
+                c = clauses[ci]
+                if c is None:
+                    continue  # Cláusula aprendida apagada
+                if c[0] == false_lit:
+                    c[0], c[1] = c[1], false_lit
+                first = c[0]
+                first_value = value[first] if first > 0 else -value[-first]
+                if first_value == 1:
+                    kept.append(ci)
+                    continue
+                for k in range(2, len(c)):
+                    lit = c[k]
+                    if (value[lit] if lit > 0 else -value[-lit]) != -1:
+                        c[1], c[k] = lit, false_lit
+                        watches[lit].append(ci)
+                        break
+                else:
+                    kept.append(ci)
+                    if first_value == -1:
+                        kept.extend(ws[i + 1:])
+                        watches[false_lit] = kept
+                        self.qhead = len(trail)
+                        return ci
+                    self._assign(first, ci)
+            watches[false_lit] = kept
+        return None
+
+    def _bump(self, v: int):
+        activity = self.activity
+        activity[v] += self.var_inc
+        if activity[v] > 1e100:
+            for u in range(1, self.num_vars + 1):
+                activity[u] *= 1e-100
+            self.var_inc *= 1e-100
+            self._rebuild_heap()
+        else:
+            heapq.heappush(self.heap, (-activity[v], v))
+
+    def _rebuild_heap(self):
+        self.heap = [(-self.activity[v], v) for v in range(1, self.num_vars + 1) if self.value[v] == 0]
+        heapq.heapify(self.heap)
+
+    def _pick(self):
+        """Devolve a variável por atribuir com maior atividade, ou None se já estão todas atribuídas."""
+        if len(self.heap) > 10 * self.num_vars + 1000:
+            self._rebuild_heap()
+        heap, value, activity = self.heap, self.value, self.activity
+        while heap:
+            negative_activity, v = heapq.heappop(heap)
+            if value[v] == 0 and -negative_activity == activity[v]:
+                return v
+        return None
+
+    def _analyze(self, ci: int) -> tuple:
+        """Deriva a cláusula aprendida do conflito (esquema 1UIP). Devolve (cláusula, nível para
+        onde recuar, LBD); o primeiro literal da cláusula é o que fica implicado depois do recuo."""
+        clauses, level, reason, seen, trail = self.clauses, self.level, self.reason, self.seen, self.trail
+        current = len(self.trail_lim)
+        learnt, marked = [0], []
+        counter, p, index = 0, 0, len(trail) - 1
+        clause = clauses[ci]
+        while True:
+            for q in clause:
+                v = abs(q)
+                if q != p and not seen[v] and level[v] > 0:
+                    seen[v] = True
+                    marked.append(v)
+                    self._bump(v)
+                    if level[v] >= current:
+                        counter += 1
+                    else:
+                        learnt.append(q)
+            while not seen[abs(trail[index])]:
+                index -= 1
+            p = trail[index]
+            index -= 1
+            counter -= 1
+            if counter == 0:
+                break
+            clause = clauses[reason[abs(p)]]
+        learnt[0] = -p
+        # Minimização local: retira os literais implicados só por literais já na cláusula
+        minimized = [learnt[0]]
+        for q in learnt[1:]:
+            r = reason[abs(q)]
+            if r is None or any(not seen[abs(x)] and level[abs(x)] > 0 for x in clauses[r][1:]):
+                minimized.append(q)
+        for v in marked:
+            seen[v] = False
+        back_level = 0
+        if len(minimized) > 1:
+            best = max(range(1, len(minimized)), key=lambda i: level[abs(minimized[i])])
+            minimized[1], minimized[best] = minimized[best], minimized[1]
+            back_level = level[abs(minimized[1])]
+        return minimized, back_level, len({level[abs(q)] for q in minimized})
+
+    def _search(self, limit: int, budget=None):
+        """Procura até encontrar um modelo (True), provar que não existe (False), atingir
+        limit conflitos (None, para reiniciar) ou esgotar o orçamento ('budget')."""
+        conflicts = 0
+        while True:
+            ci = self._propagate()
+            if ci is not None:
+                self.conflicts += 1
+                conflicts += 1
+                if budget is not None and not budget.charge():
+                    return 'budget'
+                if not self.trail_lim:
+                    self.ok = False
+                    return False
+                learnt, back_level, lbd = self._analyze(ci)
+                self._cancel(back_level)
+                if len(learnt) == 1:
+                    self._assign(learnt[0], None)
+                else:
+                    ci = len(self.clauses)
+                    self.clauses.append(learnt)
+                    self.watches[learnt[0]].append(ci)
+                    self.watches[learnt[1]].append(ci)
+                    self.learnt.append(ci)
+                    self.lbd[ci] = lbd
+                    self._assign(learnt[0], ci)
+                self.var_inc /= VAR_DECAY
+                if len(self.lbd) >= self.max_learnt:
+                    self._reduce()
+            elif conflicts >= limit:
+                return None
+            else:
+                v = self._pick()
+                if v is None:
+                    self.model = self.value[:]
+                    return True
+                self.decisions += 1
+                self.trail_lim.append(len(self.trail))
+                self._assign(v if self.phase[v] > 0 else -v, None)
+
+    def _reduce(self):
+        """Apaga metade das cláusulas aprendidas, as de maior LBD, exceto as que são razão de
+        uma atribuição atual e as de LBD <= 2."""
+        clauses, reason = self.clauses, self.reason
+        candidates = []
+        for ci in self.learnt:
+            c = clauses[ci]
+            if c is None or self.lbd[ci] <= 2 or reason[abs(c[0])] == ci:
+                continue
+            candidates.append(ci)
+        candidates.sort(key=lambda ci: (self.lbd[ci], len(clauses[ci])))
+        for ci in candidates[len(candidates) // 2:]:
+            clauses[ci] = None
+            del self.lbd[ci]
+        self.learnt = [ci for ci in self.learnt if clauses[ci] is not None]
+        self.max_learnt *= LEARNT_GROWTH
+
+
+def negate(lit):
+    """Devolve a negação de um literal ou de uma constante True/False."""
+    if lit is True or lit is False:
+        return not lit
+    return -lit
+
+
+def add_clause(solver: Solver, lits) -> bool:
+    """Acrescenta uma cláusula cujos elementos podem ser literais ou as constantes True e False."""
+    if any(lit is True for lit in lits):
+        return True
+    return solver.add_clause([lit for lit in lits if lit is not False])
+
+
+def define_and(solver: Solver, lits):
+    """Devolve um literal equivalente à conjunção dos literais (que podem ser constantes)."""
+    if any(lit is False for lit in lits):
+        return False
+    lits = [lit for lit in lits if lit is not True]
+    if not lits:
+        return True
+    if len(lits) == 1:
+        return lits[0]
+    r = solver.new_var()
+    for lit in lits:
+        solver.add_clause([-r, lit])
+    solver.add_clause([r] + [-lit for lit in lits])
+    return r
+
+
+def _define_counter(solver: Solver, a, b, x):
+    """Devolve um literal equivalente a a ∨ (b ∧ x), em que a e b podem ser constantes."""
+    if a is True:
+        return True
+    if b is False:
+        return a
+    if b is True:
+        if a is False:
+            return x
+        r = solver.new_var()
+        solver.add_clause([-r, a, x])
+        solver.add_clause([r, -a])
+        solver.add_clause([r, -x])
+        return r
+    r = solver.new_var()
+    add_clause(solver, [-r, a, b])
+    add_clause(solver, [-r, a, x])
+    add_clause(solver, [r, -b, -x])
+    if a is not False:
+        solver.add_clause([r, -a])
+    return r
+
+
+def add_exactly(solver: Solver, lits: list, k: int) -> bool:
+    """Obriga exatamente k dos literais a serem verdadeiros, com um contador sequencial unário:
+    count[j] equivale a "pelo menos j dos literais vistos até agora são verdadeiros"."""
+    if k < 0 or k > len(lits):
+        return solver.add_clause([])
+    count = [True] + [False] * (k + 1)
+    for x in lits:
+        count = [True] + [_define_counter(solver, count[j], count[j - 1], x) for j in range(1, k + 2)]
+    return add_clause(solver, [count[k]]) and add_clause(solver, [negate(count[k + 1])])
@@ -724,10 +724,25 @@ class PriorityQueue:
     order) is returned first.
     If order is 'min', the item with minimum f(x) is
     returned first; if order is 'max', then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Also supports dict-like lookup.
+    The heap is indexed: each item maps to its heap entries, so membership and
+    lookup take O(1) and deletion O(1) plus O(log n) amortized, since a deleted
+    entry is only marked dead and dropped when it reaches the top of the heap
+    (or when dead entries outnumber live ones). Items must be hashable.
+    An item may be queued more than once, with different values:
+    >>> values = iter([5, 3, 4])
+    >>> q = PriorityQueue('min', lambda item: next(values))
+    >>> q.extend(['a', 'a', 'b'])
+    >>> q.pop(), q['a'], len(q)
+    ('a', 5, 2)
+    >>> del q['a']; q.pop(), len(q)
+    ('b', 0)
+    """
 
     def __init__(self, order='min', f=lambda x: x):
-        self.heap = []
+        self.heap = []  # Entries [f(item), item, alive]
+        self.entries = {}  # Item -> its live entries, in insertion order
+        self.size = 0
         if order == 'min':
             self.f = f
         elif order == 'max':  # now item with max f(x)
@@ -737,7 +752,10 @@ class PriorityQueue:
 
     def append(self, item):
         """Insert item at its correct position."""
-        heapq.heappush(self.heap, (self.f(item), item))
+        entry = [self.f(item), item, True]
+        self.entries.setdefault(item, []).append(entry)
+        heapq.heappush(self.heap, entry)
+        self.size += 1
 
     def extend(self, items):
         """Insert each item in items at its correct position."""
@@ -747,34 +765,49 @@ class PriorityQueue:
     def pop(self):
         """Pop and return the item (with min or max f(x) value)
         depending on the order."""
-        if self.heap:
-            return heapq.heappop(self.heap)[1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
+        heap = self.heap
+        while heap:
+            entry = heapq.heappop(heap)
+            if entry[2]:
+                self._forget(entry)
+                return entry[1]
+        raise Exception('Trying to pop from empty PriorityQueue.')
+
+    def _forget(self, entry):
+        """Remove this live entry (by identity) from the position map."""
+        key = entry[1]
+        entries = self.entries[key]
+        del entries[next(i for i, other in enumerate(entries) if other is entry)]
+        if not entries:
+            del self.entries[key]
+        self.size -= 1
 
     def __len__(self):
         """Return current capacity of PriorityQueue."""
-        return len(self.heap)
+        return self.size
 
     def __contains__(self, key):
         """Return True if the key is in PriorityQueue."""
-        return any([item == key for _, item in self.heap])
+        return key in self.entries
 
     def __getitem__(self, key):
         """Returns the first value associated with key in PriorityQueue.
         Raises KeyError if key is not present."""
-        for value, item in self.heap:
-            if item == key:
-                return value
-        raise KeyError(str(key) + " is not in the priority queue")
+        try:
+            return self.entries[key][0][0]
+        except KeyError:
+            raise KeyError(str(key) + " is not in the priority queue")
 
     def __delitem__(self, key):
         """Delete the first occurrence of key."""
-        try:
-            del self.heap[[item == key for _, item in self.heap].index(True)]
-        except ValueError:
+        if key not in self.entries:
             raise KeyError(str(key) + " is not in the priority queue")
-        heapq.heapify(self.heap)
+        entry = self.entries[key][0]
+        self._forget(entry)
+        entry[2] = False
+        if len(self.heap) > 2 * self.size + 64:
+            self.heap = [entry for entry in self.heap if entry[2]]
+            heapq.heapify(self.heap)
 
 
 # ______________________________________________________________________________